@@ -1,18 +1,33 @@
 # Core imports
 import os
+import functools
+import time
+import uuid
 import pandas as pd
-from dash import Dash, dcc, html, callback, Input, Output, State, ctx, ALL, MATCH
+from dash import Dash, dcc, html, clientside_callback, ClientsideFunction, Input, Output, State, ctx, ALL, MATCH
 from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 import plotly.express as px
 import numpy as np
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.cluster import KMeans
 import seaborn as sns
-from audio_preview import audio_previews
-from flask import send_from_directory
+from colour import Color
+from audio_preview import DOWNLOAD_DIR, audio_previews, cached_previews
+from preview_prefetch import PreviewPrefetcher, PRIORITY_VISIBLE
+from clustering import CLUSTER_NAMES, load_or_fit
+from dataset import load_dataset, dataset_version
+from figure_cache import FigureCache
+from downsample import grid_downsample, discrete_colorscale
+from catalog import GenreIndex, open_catalog
+from similarity import SIMILARITY_FEATURES, load_or_build as load_similar_songs
+from preview_server import create_blueprint, preview_url
+import metrics
 import dash
 
+# Every server-side callback is timed and counted for /metrics
+def callback(*args, **kwargs):
+    register = dash.callback(*args, **kwargs)
+    return lambda func: register(metrics.instrument_callback(func))
+
 # Debug prints
 print("Current working directory:", os.getcwd())
 print("Directory contents:", os.listdir())
@@ -38,30 +53,70 @@ else:
     # Local development
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-dataset_path = os.path.join(BASE_DIR, 'data', 'Spotify-2000.csv')
+# DATASET_PATH/ARTIFACT_DIR point the app at another catalog (e.g. the synthetic ones in benchmarks/)
+dataset_path = os.environ.get('DATASET_PATH', os.path.join(BASE_DIR, 'data', 'Spotify-2000.csv'))
+artifact_dir = os.environ.get('ARTIFACT_DIR', os.path.join(BASE_DIR, 'artifacts'))
 print(f"Looking for dataset at: {dataset_path}")
-df = pd.read_csv(dataset_path)
+df = load_dataset(dataset_path, artifact_dir)
 
-# Setting up clusters from sohini's code
-features = ['Artist', 'Acousticness', 'Liveness', 'Popularity']
-cluster_df = df[features].copy()
+# Cluster assignments come from the prebuilt artifact (see clustering.py)
+# The dataset hash is remembered by mtime and size, so workers do not re-hash the CSV
+dataset_hash = dataset_version(dataset_path, artifact_dir)
+cluster_artifact = load_or_fit(df, dataset_path, artifact_dir, dataset_hash=dataset_hash)
+df['Cluster'] = cluster_artifact['labels']
 
-le = LabelEncoder()
-cluster_df['Artist_encoded'] = le.fit_transform(cluster_df['Artist'])
+# Labels are matched to the named clusters when they are fitted, so the names stay put across refits
+cluster_names = dict(enumerate(CLUSTER_NAMES))
+df['Cluster_Name'] = df['Cluster'].map(cluster_names)
 
-scaler = StandardScaler()
-X = scaler.fit_transform(cluster_df[['Artist_encoded', 'Acousticness', 'Liveness', 'Popularity']])
+# Figures of deterministic callbacks, invalidated when the dataset or clusters change
+data_version = f"{dataset_hash}:{cluster_artifact.get('key')}"
+figure_cache = FigureCache()
+metrics.registry.add_collector(lambda: [
+    ('figure_cache_hits_total', {}, figure_cache.hits),
+    ('figure_cache_misses_total', {}, figure_cache.misses)
+])
+figure_cache.set_version(data_version)
 
-kmeans = KMeans(n_clusters=4, random_state=42, n_init=10)
-df['Cluster'] = kmeans.fit_predict(X)
+# Cache key for callbacks whose only input is the genre filter
+def genre_filter_key(selected_genres):
+    return GenreIndex.normalize(selected_genres)
 
-cluster_names = {
-    0: "Acoustic Mainstream",
-    1: "Popular Hits",
-    2: "Rising Artists",
-    3: "Live Performers"
-}
-df['Cluster_Name'] = df['Cluster'].map(cluster_names)
+# Every callback reads songs through the catalog: 'pandas' keeps the genre/cluster indexes in memory,
+# 'sqlite' pushes the filters, counts and paging down to an on-disk database shared by the workers
+# (SONGS_PAGE_SIZE sets how many top songs a page shows; page counts are shipped once for clientside paging)
+CATALOG_BACKEND = os.environ.get('CATALOG_BACKEND', 'pandas')
+SONGS_PAGE_SIZE = int(os.environ.get('SONGS_PAGE_SIZE', 10))
+catalog = open_catalog(CATALOG_BACKEND, df, artifact_dir, data_version, page_size=SONGS_PAGE_SIZE)
+CLUSTER_PAGE_COUNTS = catalog.page_counts()
+
+# "More like this": nearest neighbours on the audio features, saved next to the cluster artifact
+# (SIMILAR_SONGS sets how many are shown for the clicked song)
+SIMILAR_SONGS = int(os.environ.get('SIMILAR_SONGS', 5))
+similar_songs = load_similar_songs(df[SIMILARITY_FEATURES], artifact_dir, dataset_hash)
+# The catalog answers every query from here on
+del df
+
+# Clientside callbacks: paging runs in the browser by default (CLIENTSIDE_PAGING=0 to use the server);
+# CLIENTSIDE_GENRE_FILTER=1 ships the genre aggregates once and re-filters the histogram and top artists in the browser
+CLIENTSIDE_PAGING = os.environ.get('CLIENTSIDE_PAGING', '1') != '0'
+CLIENTSIDE_GENRE_FILTER = os.environ.get('CLIENTSIDE_GENRE_FILTER', '0') == '1'
+
+# Background preview prefetching (set PREVIEW_PREFETCH=0 to turn it off)
+PREFETCH_ENABLED = os.environ.get('PREVIEW_PREFETCH', '1') != '0'
+prefetcher = PreviewPrefetcher()
+
+# Resolve the visible page in the background and poll for its previews instead of
+# blocking the callback on Deezer (set PREVIEW_ASYNC=0 to resolve inline)
+PREVIEW_ASYNC = os.environ.get('PREVIEW_ASYNC', '1') != '0'
+PREVIEW_POLL_MS = int(os.environ.get('PREVIEW_POLL_MS', 1000))
+# Songs still unresolved after this long are shown without a preview
+PREVIEW_POLL_TIMEOUT = float(os.environ.get('PREVIEW_POLL_TIMEOUT', 60))
+# A page still pending after this long is queued again (e.g. polled by another worker)
+PREVIEW_RESUBMIT_AFTER = float(os.environ.get('PREVIEW_RESUBMIT_AFTER', 10))
+
+# Where the browser fetches previews from; point at a separate preview server to keep audio off the Dash workers
+PREVIEW_BASE_URL = os.environ.get('PREVIEW_BASE_URL', '/audio_previews').rstrip('/')
 
 # Theme colors
 BACKGROUND_COLOR = '#1E1E1E'
@@ -98,6 +153,32 @@ HIGHLIGHT_STYLE = {
     'margin': '0 2px'
 }
 
+# Scatter charts switch to a single WebGL trace above this many songs and are downsampled above SCATTER_MAX_POINTS
+SCATTER_WEBGL_THRESHOLD = int(os.environ.get('SCATTER_WEBGL_THRESHOLD', 5000))
+SCATTER_MAX_POINTS = int(os.environ.get('SCATTER_MAX_POINTS', 20000))
+
+# Genre pie: counts and the gradient palette for every slider stop are computed once
+GENRE_COUNTS = catalog.genre_counts()
+GENRE_PIE_BASE_COLORS = [
+    '#1DB954', '#1ED760', '#4B917D', '#FF6B6B', '#4A90E2',
+    '#9B59B6', '#F1C40F', '#E67E22', '#E74C3C', '#3498DB'
+]
+GENRE_PIE_STOPS = list(range(10, 150, 10)) + [149]
+
+# Returns the pie colors for the top num_genres genres
+def genre_pie_palette(num_genres):
+    base_colors = GENRE_PIE_BASE_COLORS
+    if num_genres <= len(base_colors):
+        return base_colors[:num_genres]
+    colors = []
+    for i in range(len(base_colors) - 1):
+        c1 = Color(base_colors[i])
+        c2 = Color(base_colors[i + 1])
+        colors.extend([c.hex for c in c1.range_to(c2, num_genres // len(base_colors) + 1)])
+    return colors[:num_genres]
+
+GENRE_PIE_PALETTES = {num_genres: genre_pie_palette(num_genres) for num_genres in GENRE_PIE_STOPS}
+
 # Returns formatted feature label with description
 def create_feature_label(feature_name):
     descriptions = {
@@ -161,11 +242,17 @@ def create_nav_buttons(page_number, total_pages):
         )
     ], id='nav-buttons', style={'position': 'relative', 'height': '50px', 'marginTop': '10px'})
 
+# Filled with the genre cube once the figure callbacks exist (only used with CLIENTSIDE_GENRE_FILTER)
+genre_aggregates_store = dcc.Store(id='genre-aggregates')
+
 # Layout
-app.layout = html.Div([
+layout = html.Div([
     dcc.Store(id='cluster-page', data=0),
     dcc.Store(id='audio-state', data={'playing_index': None}),
     dcc.Store(id='preview-paths', data={}),
+    dcc.Interval(id='preview-poll', interval=PREVIEW_POLL_MS, disabled=True),
+    dcc.Store(id='cluster-page-counts', data={str(c): n for c, n in CLUSTER_PAGE_COUNTS.items()}),
+    genre_aggregates_store,
     
     # Section 1: Header and Music Style Selection
     html.Div([
@@ -251,7 +338,18 @@ app.layout = html.Div([
                     ], style={'width': '100%', 'maxWidth': '1200px', 'margin': '0 auto'}),
                     html.Div(id='nav-buttons', 
                             style={'marginTop': '20px', 'textAlign': 'center'})
-                ])
+                ]),
+
+                html.Div([
+                    html.H3('More Like This',
+                           style={'textAlign': 'center', 'color': TEXT_COLOR, 'marginBottom': '20px'}),
+                    html.Div(
+                        html.P("Click a song in the chart above to find the songs that sound most like it.",
+                               style={**EXPLANATION_STYLE, 'textAlign': 'center'}),
+                        id='similar-songs',
+                        style={'maxWidth': '800px', 'margin': '0 auto', 'padding': '0 20px'}
+                    )
+                ], style={'marginTop': '40px'})
             ], style={'width': '100%', 'maxWidth': '1800px', 'margin': '0 auto', 'padding': '20px'})
         ], style={
             'width': '100%',
@@ -509,7 +607,7 @@ app.layout = html.Div([
                 id='genre-filter',
                 options=[
                     {'label': genre, 'value': genre} 
-                    for genre in sorted(df['Top Genre'].unique())
+                    for genre in catalog.genres()
                 ],
                 value='All',
                 multi=True,
@@ -540,6 +638,9 @@ app.layout = html.Div([
     })
 ], style={'backgroundColor': BACKGROUND_COLOR, 'padding': '20px', 'width': '100%', 'margin': '0 auto'})
 
+# Every page load gets its own session id, so a tab switching clusters only cancels its own prefetches
+app.layout = lambda: html.Div([dcc.Store(id='session-id', data=uuid.uuid4().hex), layout])
+
 # CSS for dropdowns
 app.index_string = '''
 <!DOCTYPE html>
@@ -632,30 +733,49 @@ app.index_string = '''
 </html>
 '''
 
+# Single WebGL trace for large selections: genres become color codes instead of one SVG trace each
+def webgl_feature_scatter(filtered_df, x_feature, y_feature):
+    keep = grid_downsample(filtered_df[x_feature], filtered_df[y_feature], SCATTER_MAX_POINTS)
+    points = filtered_df.iloc[keep]
+    genre_codes, _ = pd.factorize(points['Top Genre'].astype(str))
+    palette = px.colors.qualitative.Set3
+
+    fig = go.Figure(go.Scattergl(
+        x=points[x_feature].to_numpy(),
+        y=points[y_feature].to_numpy(),
+        mode='markers',
+        marker=dict(
+            size=6,
+            color=genre_codes % len(palette),
+            colorscale=discrete_colorscale(palette),
+            cmin=-0.5,
+            cmax=len(palette) - 0.5
+        ),
+        customdata=np.column_stack([
+            points['Title'].astype(str),
+            points['Artist'].astype(str),
+            points['Top Genre'].astype(str)
+        ]),
+        hovertemplate="<b>%{customdata[0]}</b><br>" +
+                     "Artist: %{customdata[1]}<br>" +
+                     f"{x_feature}: %{{x}}<br>" +
+                     f"{y_feature}: %{{y}}<br>" +
+                     "Genre: %{customdata[2]}<extra></extra>",
+        showlegend=False
+    ))
+    if len(points) < len(filtered_df):
+        fig.update_layout(title=f"Showing {len(points):,} of {len(filtered_df):,} songs")
+    return fig
+
 # Callbacks
 @callback(
     Output('genre-pie', 'figure'),
-    [Input('genre-filter', 'value'),
-     Input('genre-count-slider', 'value')]
+    Input('genre-count-slider', 'value')
 )
-def update_genre_pie(_, num_genres):
-    genre_counts = df['Top Genre'].value_counts().head(num_genres)
-    
-    base_colors = [
-        '#1DB954', '#1ED760', '#4B917D', '#FF6B6B', '#4A90E2',
-        '#9B59B6', '#F1C40F', '#E67E22', '#E74C3C', '#3498DB'
-    ]
-    
-    if num_genres > len(base_colors):
-        from colour import Color
-        colors = []
-        for i in range(len(base_colors) - 1):
-            c1 = Color(base_colors[i])
-            c2 = Color(base_colors[i + 1])
-            colors.extend([c.hex for c in c1.range_to(c2, num_genres // len(base_colors) + 1)])
-        colors = colors[:num_genres]
-    else:
-        colors = base_colors[:num_genres]
+@figure_cache.cached('update_genre_pie')
+def update_genre_pie(num_genres):
+    genre_counts = GENRE_COUNTS.head(num_genres)
+    colors = GENRE_PIE_PALETTES.get(num_genres) or genre_pie_palette(num_genres)
     
     fig = px.pie(values=genre_counts.values, 
                  names=genre_counts.index,
@@ -688,15 +808,15 @@ def update_genre_pie(_, num_genres):
     )
     return fig
 
-@callback(
-    Output('year-histogram', 'figure'),
-    Input('genre-filter', 'value')
-)
+@figure_cache.cached('update_year_histogram', key=genre_filter_key)
 def update_year_histogram(selected_genres):
-    filtered_df = df if not selected_genres or 'All' in selected_genres else df[df['Top Genre'].isin(selected_genres)]
+    years, counts = catalog.year_counts(selected_genres)
     
+    # Songs per year, binned by Plotly exactly as if every song were sent
     fig = go.Figure(data=[go.Histogram(
-        x=filtered_df['Year'],
+        x=years,
+        y=counts,
+        histfunc='sum',
         nbinsx=30,
         marker_color=SPOTIFY_GREEN,
         hovertemplate="Year: %{x}<br>Number of Songs: %{y}<extra></extra>"
@@ -721,24 +841,34 @@ def update_year_histogram(selected_genres):
      Input('y-feature', 'value'),
      Input('genre-filter', 'value')]
 )
+@figure_cache.cached(
+    'update_feature_correlation',
+    key=lambda x_feature, y_feature, selected_genres: (x_feature, y_feature, GenreIndex.normalize(selected_genres))
+)
 def update_feature_correlation(x_feature, y_feature, selected_genres):
-    filtered_df = df if not selected_genres or 'All' in selected_genres else df[df['Top Genre'].isin(selected_genres)]
-    
-    fig = px.scatter(filtered_df, 
-                    x=x_feature, 
-                    y=y_feature,
-                    color='Top Genre',
-                    hover_data=['Title', 'Artist'],
-                    color_discrete_sequence=px.colors.qualitative.Set3)
+    filtered_df = catalog.filter(selected_genres, [x_feature, y_feature, 'Top Genre', 'Title', 'Artist'])
     
-    fig.update_traces(
-        marker=dict(size=8),
-        hovertemplate="<b>%{customdata[0]}</b><br>" +
-                     "Artist: %{customdata[1]}<br>" +
-                     f"{x_feature}: %{{x}}<br>" +
-                     f"{y_feature}: %{{y}}<br>" +
-                     "Genre: %{marker.color}<extra></extra>"
-    )
+    if len(filtered_df) > SCATTER_WEBGL_THRESHOLD:
+        fig = webgl_feature_scatter(filtered_df, x_feature, y_feature)
+    else:
+        # Plotly Express groups categoricals by every category, including unselected ones
+        filtered_df = filtered_df.assign(**{'Top Genre': filtered_df['Top Genre'].astype(str)})
+
+        fig = px.scatter(filtered_df, 
+                        x=x_feature, 
+                        y=y_feature,
+                        color='Top Genre',
+                        hover_data=['Title', 'Artist'],
+                        color_discrete_sequence=px.colors.qualitative.Set3)
+        
+        fig.update_traces(
+            marker=dict(size=8),
+            hovertemplate="<b>%{customdata[0]}</b><br>" +
+                         "Artist: %{customdata[1]}<br>" +
+                         f"{x_feature}: %{{x}}<br>" +
+                         f"{y_feature}: %{{y}}<br>" +
+                         "Genre: %{marker.color}<extra></extra>"
+        )
     
     fig.update_layout(
         plot_bgcolor=PLOT_BGCOLOR,
@@ -771,17 +901,13 @@ def update_feature_correlation(x_feature, y_feature, selected_genres):
     )
     return fig
 
-@callback(
-    Output('top-artists', 'figure'),
-    Input('genre-filter', 'value')
-)
+@figure_cache.cached('update_top_artists', key=genre_filter_key)
 def update_top_artists(selected_genres):
-    filtered_df = df if not selected_genres or 'All' in selected_genres else df[df['Top Genre'].isin(selected_genres)]
-    top_artists = filtered_df['Artist'].value_counts().head(15)
+    artists, counts = catalog.top_artists(selected_genres, 15)
     
     fig = go.Figure(data=[go.Bar(
-        x=top_artists.index,
-        y=top_artists.values,
+        x=artists,
+        y=counts,
         marker_color=SPOTIFY_GREEN,
         hovertemplate="Artist: %{x}<br>Number of Songs: %{y}<extra></extra>"
     )])
@@ -800,16 +926,52 @@ def update_top_artists(selected_genres):
     )
     return fig
 
+# The histogram and top artists either re-filter in the browser from the shipped aggregates or on the server
+if CLIENTSIDE_GENRE_FILTER:
+    genre_aggregates_store.data = {
+        'cube': catalog.to_client(),
+        'year_histogram': update_year_histogram('All'),
+        'top_artists': update_top_artists('All')
+    }
+    clientside_callback(
+        ClientsideFunction(namespace='genre_filter', function_name='year_histogram'),
+        Output('year-histogram', 'figure'),
+        Input('genre-filter', 'value'),
+        State('genre-aggregates', 'data')
+    )
+    clientside_callback(
+        ClientsideFunction(namespace='genre_filter', function_name='top_artists'),
+        Output('top-artists', 'figure'),
+        Input('genre-filter', 'value'),
+        State('genre-aggregates', 'data')
+    )
+else:
+    callback(
+        Output('year-histogram', 'figure'),
+        Input('genre-filter', 'value')
+    )(update_year_histogram)
+    callback(
+        Output('top-artists', 'figure'),
+        Input('genre-filter', 'value')
+    )(update_top_artists)
+
 @callback(
     Output('popularity-trend', 'figure'),
     Input('genre-filter', 'value')
 )
+@figure_cache.cached('update_popularity_trend', key=genre_filter_key)
 def update_popularity_trend(selected_genres):
-    filtered_df = df if not selected_genres or 'All' in selected_genres else df[df['Top Genre'].isin(selected_genres)]
+    filtered_df = catalog.filter(selected_genres, ['Year', 'Popularity', 'Title', 'Artist'])
     
+    # Large selections switch to WebGL and a density-aware sample of the songs
+    scatter = go.Scatter
+    if len(filtered_df) > SCATTER_WEBGL_THRESHOLD:
+        scatter = go.Scattergl
+        filtered_df = filtered_df.iloc[grid_downsample(filtered_df['Year'], filtered_df['Popularity'], SCATTER_MAX_POINTS)]
+
     fig = go.Figure()
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(scatter(
         x=filtered_df['Year'],
         y=filtered_df['Popularity'],
         mode='markers',
@@ -835,10 +997,10 @@ def update_popularity_trend(selected_genres):
         customdata=filtered_df['Artist']
     ))
     
-    year_avg = filtered_df.groupby('Year')['Popularity'].mean().reset_index()
+    avg_years, avg_popularity = catalog.yearly_mean_popularity(selected_genres)
     fig.add_trace(go.Scatter(
-        x=year_avg['Year'],
-        y=year_avg['Popularity'],
+        x=avg_years,
+        y=avg_popularity,
         mode='lines',
         line=dict(color=SPOTIFY_GREEN, width=3),
         name='Average Popularity',
@@ -873,12 +1035,11 @@ def update_popularity_trend(selected_genres):
     Output('radar-chart', 'figure'),
     [Input('cluster-selector', 'value')]
 )
+@figure_cache.cached('update_radar_chart')
 def update_radar_chart(selected_cluster):
     try:
-        cluster_data = df[df['Cluster'] == selected_cluster].copy()
-        
         radar_features = ['Acousticness', 'Liveness', 'Popularity', 'Energy', 'Danceability', 'Valence']
-        mean_values = cluster_data[radar_features].mean()
+        mean_values = catalog.cluster_means(selected_cluster, radar_features)
         
         fig = go.Figure()
         
@@ -921,38 +1082,163 @@ def update_radar_chart(selected_cluster):
         traceback.print_exc()
         raise
 
+SONG_CONTROL_STYLE = {
+    'display': 'flex',
+    'alignItems': 'center',
+    'marginBottom': '15px',
+    'backgroundColor': PLOT_BGCOLOR,
+    'padding': '10px',
+    'borderRadius': '5px'
+}
+
+# Audio control row for one song; rows are built once per catalog row and preview and reused across pages.
+# Component ids use the row id: the song id hashes title and artist, so repeated songs would share it.
+@functools.lru_cache(maxsize=4096)
+def song_control(row, title, artist, src):
+    return html.Div([
+        html.Span(
+            title,
+            style={'color': TEXT_COLOR, 'marginRight': '10px'}
+        ),
+        html.Span(
+            f"by {artist}",
+            style={'color': TEXT_COLOR, 'opacity': '0.7', 'marginRight': '10px'}
+        ),
+        html.Audio(
+            id={'type': 'song-preview', 'index': row},
+            src=src,
+            controls=True,  # Show the native audio controls
+            style={
+                'height': '30px',
+                'verticalAlign': 'middle'
+            },
+            **{'data-title': title}
+        )
+    ], style=SONG_CONTROL_STYLE)
+
+# Placeholder row for a song whose preview is still being fetched
+@functools.lru_cache(maxsize=4096)
+def pending_control(title, artist):
+    return html.Div([
+        html.Span(
+            title,
+            style={'color': TEXT_COLOR, 'marginRight': '10px'}
+        ),
+        html.Span(
+            f"by {artist}",
+            style={'color': TEXT_COLOR, 'opacity': '0.7', 'marginRight': '10px'}
+        ),
+        html.Span(
+            "Loading preview...",
+            style={'color': TEXT_COLOR, 'opacity': '0.5', 'fontStyle': 'italic'}
+        )
+    ], style=SONG_CONTROL_STYLE)
+
+# Returns the songs on one page of a cluster (sorted by popularity), the clamped page number and the page count
+def get_cluster_page(selected_cluster, page_number):
+    rows, page_number, total_pages = catalog.cluster_page(selected_cluster, page_number)
+    top_songs = catalog.songs(rows)
+    return top_songs, page_number, total_pages
+
+# Resolves the current page once and shares it with the songs chart and the audio controls.
+# Previews that are not cached yet are resolved in the background; the poll interval
+# refreshes the page with them as they arrive.
 @callback(
-    [Output('songs-chart', 'figure'),
-     Output('preview-paths', 'data')],
+    [Output('preview-paths', 'data'),
+     Output('preview-poll', 'disabled')],
     [Input('cluster-selector', 'value'),
-     Input('cluster-page', 'data')]
+     Input('cluster-page', 'data'),
+     Input('preview-poll', 'n_intervals')],
+    [State('preview-paths', 'data'),
+     State('session-id', 'data')]
 )
-def update_songs_chart(selected_cluster, page_number):
+def resolve_page(selected_cluster, page_number, _, current, session_id=None):
     try:
-        if page_number is None:
-            page_number = 0
-            
-        cluster_data = df[df['Cluster'] == selected_cluster].copy()
-        total_songs = len(cluster_data)
-        total_pages = (total_songs + 9) // 10
-        page_number = max(0, min(page_number, total_pages - 1))
-        
-        start_idx = page_number * 10
-        top_songs = cluster_data.sort_values('Popularity', ascending=False).iloc[start_idx:start_idx + 10]
+        if ctx.triggered_id == 'preview-poll':
+            return poll_page(current)
+
+        top_songs, page_number, total_pages = get_cluster_page(selected_cluster, page_number)
+
+        # Drop this session's queued prefetches for other clusters before resolving this page
+        prefetcher.set_active_group(selected_cluster, session=session_id)
 
         # Get preview paths
-        preview_paths = audio_previews(top_songs)
+        if PREVIEW_ASYNC:
+            preview_paths, pending = cached_previews(top_songs)
+            if pending:
+                # No group: the page on screen is never cancelled by another switch, whoever makes it
+                prefetcher.submit((selected_cluster, page_number), top_songs, priority=PRIORITY_VISIBLE)
+        else:
+            preview_paths, pending = audio_previews(top_songs), []
+
+        # Warm the neighbouring pages so Previous/Next hit the cache
+        if PREFETCH_ENABLED:
+            for adjacent_page in (page_number + 1, page_number - 1):
+                if 0 <= adjacent_page < total_pages:
+                    adjacent_songs, _, _ = get_cluster_page(selected_cluster, adjacent_page)
+                    prefetcher.submit((selected_cluster, adjacent_page), adjacent_songs, group=selected_cluster,
+                                      session=session_id)
+
+        page = {
+            'cluster': selected_cluster,
+            'page': page_number,
+            'total_pages': total_pages,
+            'rows': top_songs.index.tolist(),
+            'paths': preview_paths,
+            'pending': pending,
+            'requested_at': time.time()
+        }
+        return page, not pending
+
+    except Exception as e:
+        print(f"Error in resolve_page: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+# Returns the page with previews resolved since the last poll, and whether to stop polling
+def poll_page(page):
+    if not page or not page.get('pending'):
+        return dash.no_update, True
+
+    waited = time.time() - page['requested_at']
+    if waited > PREVIEW_POLL_TIMEOUT:
+        # Give up on the stragglers; they show up once resolved on a later visit
+        return {**page, 'pending': []}, True
+
+    top_songs = catalog.songs(page['rows'])
+    preview_paths, pending = cached_previews(top_songs)
+    key = (page['cluster'], page['page'])
+    if pending and waited > PREVIEW_RESUBMIT_AFTER and not prefetcher.is_pending(key):
+        prefetcher.submit(key, top_songs, priority=PRIORITY_VISIBLE)
+    if pending == page['pending']:
+        return dash.no_update, False
+    return {**page, 'paths': preview_paths, 'pending': pending}, not pending
+
+@callback(
+    Output('songs-chart', 'figure'),
+    Input('preview-paths', 'data')
+)
+def update_songs_chart(page):
+    try:
+        if not page:
+            raise PreventUpdate
+
+        top_songs = catalog.songs(page['rows'])
+        titles = top_songs['Title'].to_numpy(dtype=object)
+        artists = top_songs['Artist'].to_numpy(dtype=object)
 
         fig = go.Figure()
 
         fig.add_trace(go.Bar(
-            x=top_songs['Popularity'],
-            y=[f"  {row['Title']}" for _, row in top_songs.iterrows()],
+            x=top_songs['Popularity'].to_numpy(),
+            y=np.char.add('  ', titles.astype(str)),
             orientation='h',
             marker_color=SPOTIFY_GREEN,
-            text=top_songs['Artist'],
+            text=artists,
             textposition='auto',
-            customdata=list(zip(top_songs['Title'], top_songs['Artist'])),
+            # The row id lets a click open the "More Like This" panel for the song
+            customdata=np.column_stack([titles, artists, top_songs.index.to_numpy()]),
             hovertemplate="%{customdata[0]} by %{customdata[1]}<br>Popularity: %{x}<extra></extra>"
         ))
 
@@ -974,11 +1260,13 @@ def update_songs_chart(selected_cluster, page_number):
                 automargin=True
             ),
             margin=dict(t=0, b=50, l=150, r=50),
-            height=400
+            height=max(400, 40 * len(top_songs))
         )
         
-        return fig, preview_paths
+        return fig
 
+    except PreventUpdate:
+        raise
     except Exception as e:
         print(f"Error in update_songs_chart: {str(e)}")
         import traceback
@@ -988,53 +1276,30 @@ def update_songs_chart(selected_cluster, page_number):
 @callback(
     [Output('audio-controls', 'children'),
      Output('nav-buttons', 'children')],
-    [Input('cluster-selector', 'value'),
-     Input('cluster-page', 'data')]
+    Input('preview-paths', 'data')
 )
-def update_controls(selected_cluster, page_number):
+def update_controls(page):
     try:
-        if page_number is None:
-            page_number = 0
-            
-        cluster_data = df[df['Cluster'] == selected_cluster].copy()
-        total_songs = len(cluster_data)
-        total_pages = (total_songs + 9) // 10
-        page_number = max(0, min(page_number, total_pages - 1))
-        
-        start_idx = page_number * 10
-        top_songs = cluster_data.sort_values('Popularity', ascending=False).iloc[start_idx:start_idx + 10]
-        
-        preview_paths = audio_previews(top_songs)
-        
+        if not page:
+            raise PreventUpdate
+
+        top_songs = catalog.songs(page['rows'])
+        page_number = page['page']
+        total_pages = page['total_pages']
+        preview_paths = page['paths']
+        pending = set(page.get('pending', []))
+
         # Create audio controls - now in reverse order to match graph
+        rows = top_songs.index.tolist()[::-1]
+        song_ids = top_songs['Song_ID'].to_numpy(dtype=object)[::-1]
+        titles = top_songs['Title'].to_numpy(dtype=object)[::-1]
+        artists = top_songs['Artist'].to_numpy(dtype=object)[::-1]
         audio_controls = html.Div([
-            html.Div([
-                html.Span(
-                    row['Title'],
-                    style={'color': TEXT_COLOR, 'marginRight': '10px'}
-                ),
-                html.Span(
-                    f"by {row['Artist']}",
-                    style={'color': TEXT_COLOR, 'opacity': '0.7', 'marginRight': '10px'}
-                ),
-                html.Audio(
-                    id={'type': 'song-preview', 'index': idx},
-                    src=f"/audio_previews/{os.path.basename(preview_paths[row['Title']])}" if row['Title'] in preview_paths else "",
-                    controls=True,  # Show the native audio controls
-                    style={
-                        'height': '30px',
-                        'verticalAlign': 'middle'
-                    },
-                    **{'data-title': row['Title']}
-                )
-            ], style={
-                'display': 'flex',
-                'alignItems': 'center',
-                'marginBottom': '15px',
-                'backgroundColor': PLOT_BGCOLOR,
-                'padding': '10px',
-                'borderRadius': '5px'
-            }) for idx, (_, row) in enumerate(top_songs.iloc[::-1].iterrows()) if row['Title'] in preview_paths
+            song_control(row, title, artist, preview_url(PREVIEW_BASE_URL, song_id, preview_paths[song_id]))
+            if song_id in preview_paths
+            else pending_control(title, artist)
+            for row, song_id, title, artist in zip(rows, song_ids, titles, artists)
+            if song_id in preview_paths or song_id in pending
         ], style={
             'maxWidth': '800px',
             'margin': '0 auto',
@@ -1085,20 +1350,90 @@ def update_controls(selected_cluster, page_number):
 
         return audio_controls, nav_buttons
 
+    except PreventUpdate:
+        raise
     except Exception as e:
         print(f"Error in update_controls: {str(e)}")
         import traceback
         traceback.print_exc()
         raise
 
+# Row of the "More Like This" panel; the audio ids are separate from the song list's so a song can be in both
+def similar_control(row, title, artist, cluster_name, src):
+    children = [
+        html.Span(
+            title,
+            style={'color': TEXT_COLOR, 'marginRight': '10px'}
+        ),
+        html.Span(
+            f"by {artist}",
+            style={'color': TEXT_COLOR, 'opacity': '0.7', 'marginRight': '10px'}
+        ),
+        html.Span(
+            cluster_name,
+            style={**HIGHLIGHT_STYLE, 'fontSize': '0.8em', 'marginRight': '10px'}
+        )
+    ]
+    if src:
+        children.append(html.Audio(
+            id={'type': 'similar-preview', 'index': row},
+            src=src,
+            controls=True,
+            style={
+                'height': '30px',
+                'verticalAlign': 'middle'
+            },
+            **{'data-title': title}
+        ))
+    return html.Div(children, style=SONG_CONTROL_STYLE)
+
+# Lists the songs nearest to the one clicked in the songs chart, with the previews that are already cached
+# (the others are queued, so they play the next time the song is clicked)
 @callback(
-    Output('cluster-page', 'data'),
-    [Input('prev-button', 'n_clicks'),
-     Input('next-button', 'n_clicks'),
-     Input('cluster-selector', 'value')],
-    [State('cluster-page', 'data')],
+    Output('similar-songs', 'children'),
+    Input('songs-chart', 'clickData'),
     prevent_initial_call=True
 )
+def update_similar_songs(click_data):
+    try:
+        if not click_data or not click_data.get('points'):
+            raise PreventUpdate
+
+        row = int(click_data['points'][0]['customdata'][2])
+        rows, _ = similar_songs.query(row, SIMILAR_SONGS)
+        song = catalog.songs([row]).iloc[0]
+        similar = catalog.songs(rows)
+
+        if PREVIEW_ASYNC:
+            preview_paths, pending = cached_previews(similar)
+            if pending:
+                prefetcher.submit(('similar', row), similar, priority=PRIORITY_VISIBLE)
+        else:
+            preview_paths = audio_previews(similar)
+
+        return [
+            html.P([
+                "Songs that sound like ",
+                html.Span(song['Title'], style={'color': SPOTIFY_GREEN, 'fontWeight': 'bold'}),
+                f" by {song['Artist']}:"
+            ], style=EXPLANATION_STYLE)
+        ] + [
+            similar_control(row, title, artist, cluster_name,
+                            preview_url(PREVIEW_BASE_URL, song_id, preview_paths[song_id])
+                            if song_id in preview_paths else None)
+            for row, song_id, title, artist, cluster_name in zip(
+                similar.index.tolist(), similar['Song_ID'], similar['Title'], similar['Artist'],
+                similar['Cluster_Name'])
+        ]
+
+    except PreventUpdate:
+        raise
+    except Exception as e:
+        print(f"Error in update_similar_songs: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise
+
 def update_page(prev_clicks, next_clicks, selected_cluster, current_page):
     from dash import ctx
     if not ctx.triggered:
@@ -1112,8 +1447,7 @@ def update_page(prev_clicks, next_clicks, selected_cluster, current_page):
     if trigger_id == 'cluster-selector':
         return 0
         
-    total_songs = len(df[df['Cluster'] == selected_cluster])
-    total_pages = (total_songs + 9) // 10
+    total_pages = CLUSTER_PAGE_COUNTS.get(selected_cluster, 1)
     
     if trigger_id == 'prev-button' and current_page > 0:
         return max(0, current_page - 1)
@@ -1122,12 +1456,43 @@ def update_page(prev_clicks, next_clicks, selected_cluster, current_page):
     
     return current_page
 
-# Add this to serve the audio files
-@app.server.route('/audio_previews/<path:path>')
-def serve_audio(path):
-    return send_from_directory('audio_previews', path)
+# Paging is pure UI state, so by default it runs in the browser (assets/clientside.js)
+if CLIENTSIDE_PAGING:
+    clientside_callback(
+        ClientsideFunction(namespace='paging', function_name='update_page'),
+        Output('cluster-page', 'data'),
+        [Input('prev-button', 'n_clicks'),
+         Input('next-button', 'n_clicks'),
+         Input('cluster-selector', 'value')],
+        [State('cluster-page', 'data'),
+         State('cluster-page-counts', 'data')],
+        prevent_initial_call=True
+    )
+else:
+    callback(
+        Output('cluster-page', 'data'),
+        [Input('prev-button', 'n_clicks'),
+         Input('next-button', 'n_clicks'),
+         Input('cluster-selector', 'value')],
+        [State('cluster-page', 'data')],
+        prevent_initial_call=True
+    )(update_page)
+
+# Warm page 0 of every cluster in the background at startup
+if PREFETCH_ENABLED:
+    for cluster_id in cluster_names:
+        first_page, _, _ = get_cluster_page(cluster_id, 0)
+        prefetcher.submit((cluster_id, 0), first_page)
+
+# Serve the audio files (see preview_server for offloading them from the Dash workers)
+app.server.register_blueprint(create_blueprint(DOWNLOAD_DIR))
+
+# Callback latency, response size and preview cache metrics in Prometheus format at /metrics
+metrics.init_app(app.server)
 
 if __name__ == '__main__':
     # Get port from environment variable or use 8050 as default
     port = int(os.environ.get('PORT', 8050))
+    # Single process: start the counters from zero like a gunicorn master does (gunicorn.conf.py)
+    metrics.registry.clear()
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,101 @@
+// Clientside callbacks: pure UI state that does not need a server round trip
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    paging: {
+        // Mirrors update_page in app.py using the page counts shipped in cluster-page-counts
+        update_page: function(prevClicks, nextClicks, selectedCluster, currentPage, pageCounts) {
+            const ctx = window.dash_clientside.callback_context;
+            if (!ctx.triggered || !ctx.triggered.length) {
+                return window.dash_clientside.no_update;
+            }
+            const triggerId = ctx.triggered[0].prop_id.split('.')[0];
+
+            if (currentPage === null || currentPage === undefined) {
+                currentPage = 0;
+            }
+            if (triggerId === 'cluster-selector') {
+                return 0;
+            }
+
+            const totalPages = pageCounts[String(selectedCluster)] || 1;
+            if (triggerId === 'prev-button' && currentPage > 0) {
+                return Math.max(0, currentPage - 1);
+            } else if (triggerId === 'next-button' && currentPage < totalPages - 1) {
+                return Math.min(totalPages - 1, currentPage + 1);
+            }
+            return currentPage;
+        }
+    },
+
+    genre_filter: {
+        // Indexes of the selected genres in the aggregates, or null for all genres
+        _selected: function(selectedGenres, aggregates) {
+            if (!selectedGenres || !selectedGenres.length || selectedGenres.indexOf('All') !== -1) {
+                return null;
+            }
+            const genres = typeof selectedGenres === 'string' ? [selectedGenres] : selectedGenres;
+            return genres
+                .map(function(genre) { return aggregates.genres.indexOf(genre); })
+                .filter(function(i) { return i !== -1; })
+                .filter(function(i, pos, arr) { return arr.indexOf(i) === pos; });
+        },
+
+        _rows: function(selected, aggregates) {
+            if (selected !== null) {
+                return selected;
+            }
+            return aggregates.genres.map(function(_, i) { return i; });
+        },
+
+        // Same figure as update_year_histogram, summed from the per-genre year counts
+        year_histogram: function(selectedGenres, aggregates) {
+            if (!aggregates) {
+                return window.dash_clientside.no_update;
+            }
+            const cube = aggregates.cube;
+            const rows = this._rows(this._selected(selectedGenres, cube), cube);
+            const counts = cube.years.map(function() { return 0; });
+            rows.forEach(function(g) {
+                cube.year_counts[g].forEach(function(n, y) { counts[y] += n; });
+            });
+
+            const x = [], y = [];
+            counts.forEach(function(n, i) {
+                if (n > 0) {
+                    x.push(cube.years[i]);
+                    y.push(n);
+                }
+            });
+
+            const figure = JSON.parse(JSON.stringify(aggregates.year_histogram));
+            figure.data[0].x = x;
+            figure.data[0].y = y;
+            return figure;
+        },
+
+        // Same figure as update_top_artists, summed from the per-genre artist counts
+        top_artists: function(selectedGenres, aggregates) {
+            if (!aggregates) {
+                return window.dash_clientside.no_update;
+            }
+            const cube = aggregates.cube;
+            const rows = this._rows(this._selected(selectedGenres, cube), cube);
+            const totals = {};
+            rows.forEach(function(g) {
+                for (let k = cube.artist_indptr[g]; k < cube.artist_indptr[g + 1]; k++) {
+                    const artist = cube.artist_indices[k];
+                    totals[artist] = (totals[artist] || 0) + cube.artist_counts[k];
+                }
+            });
+
+            const top = Object.keys(totals)
+                .map(function(artist) { return [Number(artist), totals[artist]]; })
+                .sort(function(a, b) { return b[1] - a[1] || a[0] - b[0]; })
+                .slice(0, 15);
+
+            const figure = JSON.parse(JSON.stringify(aggregates.top_artists));
+            figure.data[0].x = top.map(function(pair) { return cube.artists[pair[0]]; });
+            figure.data[0].y = top.map(function(pair) { return pair[1]; });
+            return figure;
+        }
+    }
+});
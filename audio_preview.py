@@ -4,67 +4,400 @@ import librosa
 import requests
 import os
 import deezer
+import atexit
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from preview_index import PreviewIndex, song_id
+from preview_store import PREVIEW_CACHE_BYTES, PreviewStore
+from metrics import registry as metrics
 
-def audio_previews(current_songs_df):
+# Defaults for the concurrent resolver
+DOWNLOAD_DIR = "audio_previews"
+MAX_WORKERS = int(os.environ.get('PREVIEW_MAX_WORKERS', 10))
+REQUEST_TIMEOUT = float(os.environ.get('PREVIEW_TIMEOUT', 10))
+INDEX_FILENAME = "index.jsonl"
+
+# Shared HTTP connection pool: keep-alive connections per host, and retries with
+# exponential backoff for connection errors, 429s and 5xx answers
+POOL_SIZE = int(os.environ.get('PREVIEW_POOL_SIZE', 16))
+HTTP_RETRIES = int(os.environ.get('PREVIEW_HTTP_RETRIES', 2))
+HTTP_BACKOFF = float(os.environ.get('PREVIEW_HTTP_BACKOFF', 0.5))
+
+_indexes = {}
+_stores = {}
+_indexes_lock = threading.Lock()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout=REQUEST_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(*args, **kwargs)
+
+
+class RateLimiter:
+    """Token bucket shared between threads: at most `rate` calls per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+def make_session(timeout=REQUEST_TIMEOUT, pool_size=POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
     """
-    Get audio previews for currently displayed songs.
-    
+    Build a pooled HTTP session for Deezer searches and preview downloads.
+
     Args:
-        current_songs_df: DataFrame with 'Title' and 'Artist' columns
-    
-    Returns:
-        dict: Song titles mapped to their preview file paths
+        timeout: Default per-request timeout in seconds
+        pool_size: Keep-alive connections kept per host, at least the number of
+            resolver threads so they never queue for a connection
+        retries: Retries for connection errors, 429s and 5xx answers
+        backoff: Backoff factor between retries (backoff, 2*backoff, ... seconds)
+    """
+    session = TimeoutSession(timeout)
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def make_client(timeout=REQUEST_TIMEOUT, api_url=None):
+    """
+    Build a Deezer client on a pooled session whose requests time out after `timeout` seconds.
+
+    Args:
+        timeout: Per-request timeout in seconds
+        api_url: Override for the Deezer API base URL (e.g. a local stub server)
     """
-    print("\nStarting audio preview search...")
     client = deezer.Client()
-    download_dir = "audio_previews"
-    os.makedirs(download_dir, exist_ok=True)
-    preview_paths = {}
-
-    for _, row in current_songs_df.iterrows():
-        title = row['Title']
-        artist = row['Artist']
-        search_query = f"{title} {artist}"
-        print(f"\nSearching for: {search_query}")
-        
+    client.session.close()
+    client.session = make_session(timeout, max(POOL_SIZE, MAX_WORKERS))
+    if api_url:
+        client.base_url = api_url.rstrip('/')
+    return client
+
+
+def get_client(timeout=REQUEST_TIMEOUT, api_url=None):
+    """
+    Return the process-wide Deezer client for these settings.
+
+    Searches and downloads share its session, so connections to Deezer and
+    its CDN are kept alive across songs, pages and callbacks. Clients are
+    per process, so gunicorn workers never share sockets inherited from a fork.
+    """
+    key = (os.getpid(), timeout, api_url)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = make_client(timeout, api_url)
+        return _clients[key]
+
+
+def close_clients():
+    """Close every pooled client session (registered to run at exit)."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
+
+
+atexit.register(close_clients)
+
+
+def get_index(download_dir=DOWNLOAD_DIR):
+    """Return the shared PreviewIndex stored inside `download_dir`."""
+    path = os.path.join(download_dir, INDEX_FILENAME)
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = PreviewIndex(path)
+        return _indexes[key]
+
+
+def get_store(download_dir=DOWNLOAD_DIR, max_bytes=None):
+    """
+    Return the shared PreviewStore for `download_dir`.
+
+    The first call in a process reconciles the directory with the index,
+    dropping interrupted and truncated downloads, and applies the size budget.
+
+    Args:
+        download_dir: Directory the preview files are stored in
+        max_bytes: Budget to use instead of PREVIEW_CACHE_BYTES (e.g. no limit
+            while warming the whole catalog); None keeps the current one
+    """
+    index = get_index(download_dir)
+    key = os.path.abspath(download_dir)
+    with _indexes_lock:
+        if key not in _stores:
+            store = PreviewStore(download_dir, PREVIEW_CACHE_BYTES if max_bytes is None else max_bytes)
+            store.reconcile(index.expected_sizes())
+            before = store.total_bytes()
+            if store.evict():
+                print(f"Warning: {download_dir} held {before / 1024 / 1024:.0f} MB of previews, more than its "
+                      f"{store.max_bytes / 1024 / 1024:.0f} MB budget, and was trimmed on startup. "
+                      f"Raise PREVIEW_CACHE_BYTES to keep a warmed cache whole.")
+            _stores[key] = store
+        elif max_bytes is not None:
+            _stores[key].max_bytes = max_bytes
+        return _stores[key]
+
+
+def preview_filepath(song_id, download_dir=DOWNLOAD_DIR):
+    """Local path a song's preview is stored at."""
+    return os.path.join(download_dir, f"{song_id}.mp3")
+
+
+def legacy_preview_filepath(title, artist, download_dir=DOWNLOAD_DIR):
+    """Title/artist based path previews were stored at before songs had ids."""
+    filename = f"{title}_{artist}.mp3".replace(" ", "_")
+    return os.path.join(download_dir, filename)
+
+
+def resolve_preview(client, song_id, title, artist, download_dir=DOWNLOAD_DIR, timeout=REQUEST_TIMEOUT,
+                    rate_limiter=None):
+    """
+    Search Deezer for one song and download its preview if needed.
+
+    Returns:
+        dict or None: Index fields for the song ('status', 'track_id',
+        'preview_url', 'path'); status is 'missing' when Deezer has no
+        preview. None on errors, so transient failures are retried later.
+    """
+    search_query = f"{title} {artist}"
+    print(f"\nSearching for: {search_query}")
+
+    try:
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        with metrics.timer('deezer_request_duration_seconds', kind='search'):
+            # The search result is a lazy list: take the first hit in one request instead
+            # of asking for its length and then its first page
+            track = next(iter(client.search(search_query)), None)
+
+        if track is None:
+            print(f"No preview found for {title}")
+            return {'status': 'missing'}
+
+        preview_url = track.preview
+
+        if not preview_url:
+            print(f"No preview URL available for {title}")
+            return {'status': 'missing', 'track_id': getattr(track, 'id', None)}
+
+        filepath = preview_filepath(song_id, download_dir)
+        print(f"Found preview URL for '{title}'")
+
         try:
-            search_results = client.search(search_query)
-            
-            if search_results:
-                track = search_results[0]
-                preview_url = track.preview
-                
-                if preview_url:
-                    filename = f"{title}_{artist}.mp3".replace(" ", "_")
-                    filepath = os.path.join(download_dir, filename)
-                    print(f"Found preview URL for '{title}'")
-
-                    try:
-                        if not os.path.exists(filepath):
-                            print(f"Downloading preview to {filepath}")
-                            response = requests.get(preview_url, stream=True)
-                            response.raise_for_status()
-
-                            with open(filepath, 'wb') as f:
-                                for chunk in response.iter_content(chunk_size=8192):
-                                    f.write(chunk)
-                            print(f"Successfully downloaded preview for '{title}'")
-                        else:
-                            print(f"Using existing preview file for '{title}'")
-                        
-                        preview_paths[title] = filepath
-                    
-                    except requests.exceptions.RequestException as e:
-                        print(f"Error downloading preview for '{title}': {e}")
-                    except Exception as e:
-                        print(f"An unexpected error occurred for '{title}': {e}")
-                else:
-                    print(f"No preview URL available for {title}")
+            if not os.path.exists(filepath):
+                print(f"Downloading preview to {filepath}")
+                with metrics.timer('deezer_request_duration_seconds', kind='download'):
+                    response = client.session.get(preview_url, stream=True, timeout=timeout)
+                    response.raise_for_status()
+
+                    # Content-Length counts encoded bytes, so it is only checked for plain bodies
+                    expected_bytes = response.headers.get('Content-Length')
+                    if expected_bytes is None or response.headers.get('Content-Encoding'):
+                        expected_bytes = None
+                    filepath, size = get_store(download_dir).write(
+                        song_id,
+                        response.iter_content(chunk_size=8192),
+                        int(expected_bytes) if expected_bytes is not None else None
+                    )
+                print(f"Successfully downloaded preview for '{title}'")
             else:
-                print(f"No preview found for {title}")
-                
+                print(f"Using existing preview file for '{title}'")
+                size = os.path.getsize(filepath)
+
+            return {'status': 'ok', 'track_id': getattr(track, 'id', None), 'preview_url': preview_url,
+                    'path': filepath, 'bytes': size}
+
+        except requests.exceptions.RequestException as e:
+            metrics.inc('deezer_request_errors_total', kind='download')
+            print(f"Error downloading preview for '{title}': {e}")
         except Exception as e:
-            print(f"Error searching for {title}: {e}")
+            metrics.inc('deezer_request_errors_total', kind='download')
+            print(f"An unexpected error occurred for '{title}': {e}")
+
+    except Exception as e:
+        metrics.inc('deezer_request_errors_total', kind='search')
+        print(f"Error searching for {title}: {e}")
+
+    return None
+
+
+def resolve_previews(songs, max_workers=MAX_WORKERS, timeout=REQUEST_TIMEOUT,
+                     download_dir=DOWNLOAD_DIR, api_url=None, rate_limiter=None, network=True,
+                     retry_errors=False):
+    """
+    Resolve previews for a list of songs, reporting what happened to each one.
+
+    Songs are first looked up in the persistent preview index, so previews
+    already on disk and songs known to have no preview cost no network calls.
+    Songs that failed recently are backed off for PREVIEW_ERROR_TTL instead of
+    being searched again on every call. The rest are searched and downloaded
+    in parallel on a bounded thread pool.
+
+    Args:
+        songs: List of (song_id, title, artist) tuples
+        max_workers: Maximum number of songs resolved at the same time
+        timeout: Per-request timeout in seconds for searches and downloads
+        download_dir: Directory the preview files are stored in
+        api_url: Override for the Deezer API base URL (e.g. a local stub server)
+        rate_limiter: Optional RateLimiter applied to Deezer searches
+        network: False to only answer from the index and report the other
+            songs as 'pending'
+        retry_errors: True to resolve songs that failed recently right away
+            (e.g. a warm-up's own retry rounds)
+
+    Returns:
+        list: (song_id, title, artist, status, path) per song, in input order.
+        status is 'cached' or 'downloaded' when a preview is available,
+        'known_missing' or 'missing' when Deezer has none, 'error' when
+        resolution failed, 'known_error' when it failed recently and is
+        backed off, and 'pending' when it was not attempted
+    """
+    start = time.perf_counter()
+    os.makedirs(download_dir, exist_ok=True)
+    index = get_index(download_dir)
+    store = get_store(download_dir)
+    results = [None] * len(songs)
+    to_resolve = []
+
+    for i, (song, title, artist) in enumerate(songs):
+        status, filepath = index.lookup(song)
+        if status is None:
+            filepath = legacy_preview_filepath(title, artist, download_dir)
+            status = 'ok' if os.path.exists(filepath) else None
+        if status == 'ok' and filepath != preview_filepath(song, download_dir):
+            # Move files downloaded under the old title/artist names to their id
+            try:
+                os.replace(filepath, preview_filepath(song, download_dir))
+                filepath = preview_filepath(song, download_dir)
+                entry = index.get(song) or {}
+                index.record(song, title, artist, 'ok', entry.get('track_id'), entry.get('preview_url'), filepath,
+                             os.path.getsize(filepath))
+            except OSError as e:
+                print(f"Could not move {filepath}: {e}")
+                status = None
+        if status == 'ok':
+            store.touch(song)
+            results[i] = (song, title, artist, 'cached', filepath)
+        elif status == 'missing':
+            results[i] = (song, title, artist, 'known_missing', None)
+        elif status == 'error' and not (network and retry_errors):
+            results[i] = (song, title, artist, 'known_error', None)
+        elif network:
+            to_resolve.append(i)
+        else:
+            results[i] = (song, title, artist, 'pending', None)
+
+    if to_resolve:
+        client = get_client(timeout=timeout, api_url=api_url)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_resolve)))) as executor:
+            resolved = executor.map(
+                lambda i: resolve_preview(client, *songs[i], download_dir, timeout, rate_limiter),
+                to_resolve
+            )
+            for i, result in zip(to_resolve, resolved):
+                song, title, artist = songs[i]
+                if result is None:
+                    # Back off, so pollers and prefetches do not search it again right away
+                    index.record(song, title, artist, 'error')
+                    results[i] = (song, title, artist, 'error', None)
+                    continue
+                index.record(song, title, artist, **result)
+                if result['status'] == 'ok':
+                    results[i] = (song, title, artist, 'downloaded', result['path'])
+                else:
+                    results[i] = (song, title, artist, 'missing', None)
+
+    for status, count in Counter(status for _, _, _, status, _ in results).items():
+        metrics.inc('preview_lookups_total', count, status=status)
+    metrics.observe('preview_resolve_duration_seconds', time.perf_counter() - start)
+    return results
+
+
+def _songs(songs_df):
+    """(song_id, title, artist) tuples for a DataFrame, using 'Song_ID' when present."""
+    titles = songs_df['Title'].tolist()
+    artists = songs_df['Artist'].tolist()
+    if 'Song_ID' in songs_df:
+        song_ids = songs_df['Song_ID'].tolist()
+    else:
+        song_ids = [song_id(title, artist) for title, artist in zip(titles, artists)]
+    return list(zip(song_ids, titles, artists))
+
+
+def audio_previews(current_songs_df, max_workers=MAX_WORKERS, timeout=REQUEST_TIMEOUT,
+                   download_dir=DOWNLOAD_DIR, api_url=None):
+    """
+    Get audio previews for currently displayed songs.
+
+    See resolve_previews for how songs are looked up and downloaded.
+
+    Args:
+        current_songs_df: DataFrame with 'Title' and 'Artist' columns, and
+            optionally 'Song_ID' (computed from title and artist if missing)
+        max_workers: Maximum number of songs resolved at the same time
+        timeout: Per-request timeout in seconds for searches and downloads
+        download_dir: Directory the preview files are stored in
+        api_url: Override for the Deezer API base URL (e.g. a local stub server)
+
+    Returns:
+        dict: Song ids mapped to their preview file paths
+    """
+    print("\nStarting audio preview search...")
+    results = resolve_previews(_songs(current_songs_df), max_workers, timeout, download_dir, api_url)
+    preview_paths = {song: filepath for song, _, _, _, filepath in results if filepath}
 
     print(f"\nFound {len(preview_paths)} previews out of {len(current_songs_df)} songs")
-    return preview_paths
\ No newline at end of file
+    return preview_paths
+
+
+def cached_previews(current_songs_df, download_dir=DOWNLOAD_DIR):
+    """
+    Answer a page of songs from the preview cache only, without network calls.
+
+    Returns:
+        tuple: (dict of song ids mapped to preview file paths, list of the
+        song ids that still need resolving)
+    """
+    results = resolve_previews(_songs(current_songs_df), download_dir=download_dir, network=False)
+    preview_paths = {song: filepath for song, _, _, _, filepath in results if filepath}
+    pending = [song for song, _, _, status, _ in results if status == 'pending']
+    return preview_paths, pending
@@ -0,0 +1,236 @@
+"""
+Latency and memory of the dashboard callbacks as the catalog grows.
+
+For every scale a synthetic catalog is written (see synthetic_catalog.py).
+A fresh Python process then imports app.py against it, so startup, the
+cluster fit and the derived indexes are measured the way a worker pays for
+them. Each callback is called directly `--repeats` times for p50/p95
+latency, then once more under tracemalloc for its peak allocation. The
+cluster fit is timed too, next to an incremental update that assigns the
+last 1% of the catalog to clusters fitted on the rest.
+audio_previews is stubbed and prefetching is off, so no network is
+involved. The figure cache is disabled unless --figure-cache is given, so
+every call does the full work.
+
+Usage:
+    python benchmarks/bench_callbacks.py --scales 1 10 100 1000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+# The app modules live at the repository root
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard callbacks on synthetic catalogs.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help="Catalog sizes as multiples of Spotify-2000.csv")
+    parser.add_argument('--repeats', type=int, default=20, help="Timed calls per callback")
+    parser.add_argument('--cluster-repeats', type=int, default=3, help="Timed cluster fits per scale")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', default='pandas', choices=['pandas', 'sqlite'], help="Catalog backend")
+    parser.add_argument('--figure-cache', action='store_true', help="Keep the figure cache on (measures cache hits)")
+    parser.add_argument('--work-dir', default=None, help="Where catalogs and artifacts are written (default: a temp dir)")
+    parser.add_argument('--output', default=None, help="JSON results file (default: print to stdout)")
+    # Internal: run one scale inside the current process
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--scale', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def summarize(seconds):
+    samples = np.asarray(seconds) * 1000
+    return {
+        'samples': len(samples),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+        'max_ms': round(float(samples.max()), 3)
+    }
+
+
+def measure(func, calls, repeats):
+    """Time `repeats` calls cycling through `calls` (argument tuples), then one traced call for peak memory."""
+    seconds = []
+    for i in range(repeats):
+        args = calls[i % len(calls)]
+        start = time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(*calls[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(seconds)
+    result['peak_alloc_kb'] = round(peak / 1024, 1)
+    return result
+
+
+def set_trigger(prop_id):
+    """Make dash.ctx report `prop_id` as the triggering input, as inside a real callback."""
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+    context_value.set(AttributeDict(triggered_inputs=[{'prop_id': prop_id, 'value': 1}]))
+
+
+def run_worker(args):
+    """Import the app against one catalog and time its callbacks."""
+    start = time.perf_counter()
+    import app
+    startup_seconds = time.perf_counter() - start
+    from clustering import fit_clusters, update_clusters
+
+    # Network out of the picture: every song "has" a cached preview
+    app.audio_previews = lambda songs: {song: f"audio_previews/{song}.mp3" for song in songs['Song_ID']}
+
+    genres = app.GENRE_COUNTS.index[:3].tolist()
+    cluster = min(app.CLUSTER_PAGE_COUNTS)
+    rows, page_number, total_pages = app.catalog.cluster_page(cluster, 0)
+    page = {
+        'cluster': cluster,
+        'page': page_number,
+        'total_pages': total_pages,
+        'rows': rows.tolist(),
+        'paths': {},
+        'pending': []
+    }
+
+    def update_page(*call_args):
+        set_trigger('next-button.n_clicks')
+        return app.update_page(*call_args)
+
+    def resolve_page(*call_args):
+        set_trigger('cluster-page.data')
+        return app.resolve_page(*call_args)
+
+    cases = {
+        'update_genre_pie': (app.update_genre_pie, [(10,), (30,)]),
+        'update_feature_correlation': (app.update_feature_correlation, [
+            ('Energy', 'Danceability', ['All']),
+            ('Energy', 'Danceability', genres)
+        ]),
+        'update_popularity_trend': (app.update_popularity_trend, [(['All'],), (genres,)]),
+        'update_songs_chart': (app.update_songs_chart, [(page,)]),
+        'update_page': (update_page, [(1, 1, cluster, 0)]),
+        'resolve_page': (resolve_page, [(cluster, 0, None, None)]),
+        'update_similar_songs': (app.update_similar_songs, [
+            ({'points': [{'customdata': [None, None, int(row)]}]},) for row in rows[:3]
+        ]),
+    }
+
+    callbacks = {}
+    for name, (func, calls) in cases.items():
+        callbacks[name] = measure(func, calls, args.repeats)
+        print(f"[bench] {args.scale}x {name}: p50 {callbacks[name]['p50_ms']} ms, "
+              f"p95 {callbacks[name]['p95_ms']} ms", file=sys.stderr)
+
+    features = app.catalog.filter(None, ['Song_ID', 'Artist', 'Acousticness', 'Liveness', 'Popularity'])
+    callbacks['startup_clustering'] = measure(fit_clusters, [(features,)], args.cluster_repeats)
+    print(f"[bench] {args.scale}x startup_clustering: p50 {callbacks['startup_clustering']['p50_ms']} ms",
+          file=sys.stderr)
+
+    previous = fit_clusters(features.iloc[:len(features) * 99 // 100])
+    callbacks['incremental_clustering'] = measure(update_clusters, [(previous, features)], args.cluster_repeats)
+    print(f"[bench] {args.scale}x incremental_clustering: p50 {callbacks['incremental_clustering']['p50_ms']} ms",
+          file=sys.stderr)
+
+    return {
+        'scale': args.scale,
+        'rows': len(app.catalog),
+        'backend': app.CATALOG_BACKEND,
+        'startup_seconds': round(startup_seconds, 3),
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'callbacks': callbacks
+    }
+
+
+def run_scale(args, scale, work_dir):
+    from synthetic_catalog import read_source, synthetic_catalog
+
+    csv_path = os.path.join(work_dir, f"spotify-{scale}x-seed{args.seed}.csv")
+    if not os.path.exists(csv_path):
+        print(f"[bench] Writing {scale}x catalog to {csv_path}", file=sys.stderr)
+        synthetic_catalog(read_source(), scale, args.seed).to_csv(csv_path, index=False)
+
+    env = dict(
+        os.environ,
+        DATASET_PATH=csv_path,
+        ARTIFACT_DIR=os.path.join(work_dir, f"artifacts-{scale}x"),
+        # The app serves /metrics; keep its snapshots out of a real dashboard's
+        METRICS_DIR=os.path.join(work_dir, 'metrics'),
+        PREVIEW_PREFETCH='0',
+        PREVIEW_ASYNC='0',
+        CLIENTSIDE_PAGING='1',
+        CLIENTSIDE_GENRE_FILTER='0',
+        CATALOG_BACKEND=args.backend
+    )
+    if not args.figure_cache:
+        env['FIGURE_CACHE_BYTES'] = '0'
+
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--scale', str(scale),
+               '--repeats', str(args.repeats), '--cluster-repeats', str(args.cluster_repeats)]
+    # app.py looks for data/ relative to the working directory
+    completed = subprocess.run(command, cwd=BASE_DIR, env=env, stdout=subprocess.PIPE, check=True)
+    # The app prints while importing; the result is the last line
+    return json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return 0
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='spotify-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeats': args.repeats,
+            'cluster_repeats': args.cluster_repeats,
+            'figure_cache': args.figure_cache,
+            'backend': args.backend,
+            'seed': args.seed
+        },
+        'results': [run_scale(args, scale, work_dir) for scale in args.scales]
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"[bench] Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
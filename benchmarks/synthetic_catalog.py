@@ -0,0 +1,82 @@
+"""
+Synthetic catalogs with the schema and distributions of Spotify-2000.csv.
+
+A catalog at scale N holds N replicas of the dataset. Each replica is a
+bootstrap resample of the real rows, so genres, years and the joint
+distribution of the audio features are kept. Numeric features get a little
+noise, clipped to the real range. Artists and titles get a per-replica
+suffix, so the number of songs per artist also stays realistic.
+
+Usage:
+    python benchmarks/synthetic_catalog.py --scale 10 --output /tmp/spotify-10x.csv
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_CSV = os.path.join(BASE_DIR, 'data', 'Spotify-2000.csv')
+
+# Integer columns that get noise; Year, Index and the text columns are resampled as they are
+NOISY_COLUMNS = [
+    'Beats Per Minute (BPM)', 'Energy', 'Danceability', 'Loudness (dB)', 'Liveness',
+    'Valence', 'Length (Duration)', 'Acousticness', 'Speechiness', 'Popularity'
+]
+NOISE_SCALE = 0.05
+
+
+def read_source(csv_path=SOURCE_CSV):
+    source = pd.read_csv(csv_path)
+    if source['Length (Duration)'].dtype == object:
+        source['Length (Duration)'] = source['Length (Duration)'].str.replace(',', '').astype('int64')
+    return source
+
+
+def synthetic_catalog(source, scale, seed=0):
+    """
+    Build a catalog `scale` times the size of `source`.
+
+    Args:
+        source: The real dataset (see read_source)
+        scale: Number of replicas; 1 returns a resample the size of the original
+        seed: Random seed, so a scale always yields the same catalog
+
+    Returns:
+        DataFrame: Same columns and dtypes as the source
+    """
+    rng = np.random.default_rng(seed)
+    m = len(source)
+    n = m * scale
+    rows = rng.integers(0, m, n)
+    replica = np.arange(n) // m
+    catalog = source.iloc[rows].reset_index(drop=True)
+
+    for column in NOISY_COLUMNS:
+        values = source[column].to_numpy()
+        noise = rng.normal(0, NOISE_SCALE * values.std(), n)
+        catalog[column] = np.clip(np.rint(catalog[column].to_numpy() + noise), values.min(), values.max()).astype(values.dtype)
+
+    # Replica 0 keeps the real names
+    suffix = (' #' + pd.Series(replica).astype(str)).where(replica > 0, '')
+    catalog['Artist'] = catalog['Artist'].astype(str) + suffix
+    catalog['Title'] = catalog['Title'].astype(str) + suffix
+    catalog['Index'] = np.arange(1, n + 1)
+    return catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Spotify-2000 catalog.")
+    parser.add_argument('--scale', type=int, default=10, help="Catalog size as a multiple of the real dataset")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--source', default=SOURCE_CSV)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args(argv)
+
+    catalog = synthetic_catalog(read_source(args.source), args.scale, args.seed)
+    catalog.to_csv(args.output, index=False)
+    print(f"Wrote {len(catalog)} songs to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,473 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Bump when the SQLite catalog schema changes
+CATALOG_VERSION = 1
+
+
+class GenreIndex:
+    """
+    Genre -> row positions of the songs in that genre, built once at startup.
+
+    A genre selection resolves to row positions by merging the per-genre
+    arrays, so filtering costs O(selected rows) instead of a full `isin` scan.
+    The filtered DataFrame for each selection is kept in a small LRU so all the
+    genre-filter callbacks share one view per selection.
+    """
+
+    def __init__(self, df, column='Top Genre', max_views=16):
+        self.df = df
+        self.max_views = max_views
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+        codes, genres = pd.factorize(df[column], sort=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(genres) + 1))
+        self.genres = list(genres)
+        self._rows = {
+            genre: order[bounds[i]:bounds[i + 1]]
+            for i, genre in enumerate(self.genres)
+        }
+
+    @staticmethod
+    def normalize(selected_genres):
+        """Canonical form of a genre-filter value: None for "all songs", else a sorted tuple."""
+        if not selected_genres or 'All' in selected_genres:
+            return None
+        if isinstance(selected_genres, str):
+            selected_genres = [selected_genres]
+        return tuple(sorted(set(selected_genres)))
+
+    def rows(self, selected_genres):
+        """Sorted row positions for a selection, or None when every row is selected."""
+        key = self.normalize(selected_genres)
+        if key is None:
+            return None
+        parts = [self._rows[genre] for genre in key if genre in self._rows]
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        # Genres are disjoint, so a merge of the sorted parts has no duplicates
+        return np.sort(np.concatenate(parts))
+
+    def filter(self, selected_genres):
+        """DataFrame of the songs in the selected genres (shared, do not modify)."""
+        key = self.normalize(selected_genres)
+        if key is None:
+            return self.df
+        with self._lock:
+            if key in self._views:
+                self._views.move_to_end(key)
+                return self._views[key]
+        view = self.df.take(self.rows(key))
+        with self._lock:
+            self._views[key] = view
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+        return view
+
+
+class GenreCube:
+    """
+    Per-genre partial aggregates, built once at load.
+
+    Holds, for every genre, the number of songs and the popularity sum per
+    year plus the number of songs per artist. Any genre selection is answered
+    by summing the rows of the selected genres, so the year histogram, top
+    artists and yearly popularity charts never regroup raw songs.
+    """
+
+    def __init__(self, df, genre_column='Top Genre'):
+        genre_codes, genres = pd.factorize(df[genre_column], sort=True)
+        year_codes, years = pd.factorize(df['Year'], sort=True)
+        # First-appearance order breaks ties in artist counts deterministically
+        artist_codes, artists = pd.factorize(df['Artist'].astype(object))
+
+        self.genres = list(genres)
+        self.genre_positions = {genre: i for i, genre in enumerate(self.genres)}
+        self.years = np.asarray(years)
+        self.artists = np.asarray(artists, dtype=object)
+
+        n_genres, n_years = len(self.genres), len(self.years)
+        cells = genre_codes * n_years + year_codes
+        self.year_counts = np.bincount(cells, minlength=n_genres * n_years).reshape(n_genres, n_years)
+        self.popularity_sums = np.bincount(
+            cells, weights=df['Popularity'].to_numpy(dtype=np.float64), minlength=n_genres * n_years
+        ).reshape(n_genres, n_years)
+
+        # Sparse because most artists only appear in one or two genres
+        self.artist_counts = sparse.csr_matrix(
+            (np.ones(len(df), dtype=np.int64), (genre_codes, artist_codes)),
+            shape=(n_genres, len(self.artists))
+        )
+
+    def _genre_rows(self, selected_genres):
+        key = GenreIndex.normalize(selected_genres)
+        if key is None:
+            return None
+        return [self.genre_positions[genre] for genre in key if genre in self.genre_positions]
+
+    def year_counts_for(self, selected_genres):
+        """(years, song counts) for the selection, only years that have songs."""
+        rows = self._genre_rows(selected_genres)
+        counts = self.year_counts.sum(axis=0) if rows is None else self.year_counts[rows].sum(axis=0)
+        present = counts > 0
+        return self.years[present], counts[present]
+
+    def yearly_mean_popularity(self, selected_genres):
+        """(years, mean popularity) for the selection, only years that have songs."""
+        rows = self._genre_rows(selected_genres)
+        if rows is None:
+            counts = self.year_counts.sum(axis=0)
+            sums = self.popularity_sums.sum(axis=0)
+        else:
+            counts = self.year_counts[rows].sum(axis=0)
+            sums = self.popularity_sums[rows].sum(axis=0)
+        present = counts > 0
+        return self.years[present], sums[present] / counts[present]
+
+    def top_artists(self, selected_genres, n=15):
+        """(artists, song counts) of the n artists with most songs in the selection."""
+        rows = self._genre_rows(selected_genres)
+        matrix = self.artist_counts if rows is None else self.artist_counts[rows]
+        counts = np.asarray(matrix.sum(axis=0)).ravel()
+        order = np.argsort(-counts, kind='stable')[:n]
+        order = order[counts[order] > 0]
+        return self.artists[order], counts[order]
+
+    def to_client(self):
+        """Compact JSON-ready form of the cube for clientside re-filtering."""
+        artist_counts = self.artist_counts.tocsr()
+        return {
+            'genres': self.genres,
+            'years': self.years.tolist(),
+            'year_counts': self.year_counts.tolist(),
+            'artists': self.artists.tolist(),
+            'artist_indptr': artist_counts.indptr.tolist(),
+            'artist_indices': artist_counts.indices.tolist(),
+            'artist_counts': artist_counts.data.tolist()
+        }
+
+
+class ClusterIndex:
+    """
+    Cluster -> row positions sorted by popularity (highest first), built once after clustering.
+
+    A page of top songs is a slice of the presorted positions, and the page
+    count comes from the array length, so paging never scans or sorts `df`.
+    """
+
+    def __init__(self, df, page_size=10, cluster_column='Cluster'):
+        self.page_size = page_size
+        clusters = df[cluster_column].to_numpy()
+        # Stable sort keeps equally popular songs in dataset order
+        by_popularity = np.argsort(-df['Popularity'].to_numpy(), kind='stable')
+        sorted_clusters = clusters[by_popularity]
+        self._rows = {
+            int(cluster): by_popularity[sorted_clusters == cluster]
+            for cluster in np.unique(clusters)
+        }
+
+    def rows(self, cluster):
+        """All row positions of a cluster, most popular first."""
+        return self._rows.get(cluster, np.empty(0, dtype=np.intp))
+
+    def total_pages(self, cluster):
+        return (len(self.rows(cluster)) + self.page_size - 1) // self.page_size
+
+    def page_counts(self):
+        return {cluster: self.total_pages(cluster) for cluster in self._rows}
+
+    def page(self, cluster, page_number):
+        """
+        Row positions on one page of a cluster.
+
+        Returns:
+            tuple: (row positions, page number clamped to the valid range, page count)
+        """
+        total_pages = self.total_pages(cluster)
+        page_number = max(0, min(page_number or 0, total_pages - 1))
+        start = page_number * self.page_size
+        return self.rows(cluster)[start:start + self.page_size], page_number, total_pages
+
+
+class PandasCatalog:
+    """
+    Song catalog answered from the in-memory DataFrame.
+
+    Genre filters go through GenreIndex, the aggregate charts through
+    GenreCube and cluster paging through ClusterIndex. Every worker holds
+    its own copy of these structures.
+    """
+
+    def __init__(self, df, page_size=10):
+        self.df = df
+        self.genre_index = GenreIndex(df)
+        self.genre_cube = GenreCube(df)
+        self.cluster_index = ClusterIndex(df, page_size=page_size)
+
+    def __len__(self):
+        return len(self.df)
+
+    def genres(self):
+        """Sorted genre names."""
+        return [str(genre) for genre in self.genre_index.genres]
+
+    def genre_counts(self):
+        """Songs per genre, most common first (index as plain strings)."""
+        counts = self.df['Top Genre'].value_counts()
+        counts.index = counts.index.astype(str)
+        return counts
+
+    def filter(self, selected_genres, columns=None):
+        """
+        Songs in the selected genres, in dataset order (shared, do not modify).
+
+        `columns` lists the columns the caller needs; this backend returns
+        the shared view with every column instead of copying a subset.
+        """
+        return self.genre_index.filter(selected_genres)
+
+    def year_counts(self, selected_genres):
+        return self.genre_cube.year_counts_for(selected_genres)
+
+    def yearly_mean_popularity(self, selected_genres):
+        return self.genre_cube.yearly_mean_popularity(selected_genres)
+
+    def top_artists(self, selected_genres, n=15):
+        return self.genre_cube.top_artists(selected_genres, n)
+
+    def cluster_means(self, cluster, features):
+        """Mean of each feature over the songs of a cluster."""
+        return self.df.iloc[self.cluster_index.rows(cluster)][features].mean()
+
+    def page_counts(self):
+        return self.cluster_index.page_counts()
+
+    def cluster_page(self, cluster, page_number):
+        """(row ids on the page, clamped page number, page count); see ClusterIndex.page."""
+        return self.cluster_index.page(cluster, page_number)
+
+    def songs(self, rows):
+        """Songs at the given row ids, in that order, indexed by row id."""
+        return self.df.iloc[rows]
+
+    def to_client(self):
+        return self.genre_cube.to_client()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteCatalog:
+    """
+    Song catalog stored in an on-disk SQLite database.
+
+    Genre filters, year and artist counts, yearly averages and cluster
+    paging run as SQL against indexes on Top Genre, Year, Artist and
+    Cluster. Workers keep no per-process copy of the songs. The file is
+    opened read-only and memory-mapped, so all workers share its pages
+    through the OS page cache. Row ids are the song positions in the
+    dataset, so pages and selections match the pandas backend.
+    """
+
+    def __init__(self, path, page_size=10, mmap_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.page_size = page_size
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        self._size = self._query("SELECT COUNT(*) FROM songs")[0][0]
+        self._cluster_sizes = dict(self._query("SELECT Cluster, COUNT(*) FROM songs GROUP BY Cluster"))
+
+    @classmethod
+    def build(cls, df, path):
+        """
+        Write `df` (with its 'Cluster' column) to a new database at `path`.
+
+        The file is written under a temp name and renamed into place, so
+        workers building it at the same time never see half a database.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        columns = list(df.columns)
+        types = [
+            'INTEGER' if pd.api.types.is_integer_dtype(df[name])
+            else 'REAL' if pd.api.types.is_float_dtype(df[name])
+            else 'TEXT'
+            for name in columns
+        ]
+        # First-appearance artist codes break ties in artist counts like GenreCube does
+        artist_codes, _ = pd.factorize(df['Artist'].astype(object))
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute(
+                "CREATE TABLE songs (row_id INTEGER PRIMARY KEY, artist_code INTEGER, "
+                + ', '.join(f"{_quote(name)} {kind}" for name, kind in zip(columns, types)) + ")"
+            )
+            values = [
+                df[name].astype(object).tolist() if kind == 'TEXT' else df[name].to_numpy().tolist()
+                for name, kind in zip(columns, types)
+            ]
+            conn.executemany(
+                f"INSERT INTO songs VALUES ({', '.join('?' * (len(columns) + 2))})",
+                zip(range(len(df)), artist_codes.tolist(), *values)
+            )
+            conn.execute('CREATE INDEX songs_genre_year ON songs ("Top Genre", Year)')
+            conn.execute('CREATE INDEX songs_year ON songs (Year)')
+            conn.execute('CREATE INDEX songs_artist ON songs (Artist)')
+            conn.execute('CREATE INDEX songs_cluster_popularity ON songs (Cluster, Popularity DESC, row_id)')
+            conn.execute('ANALYZE')
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_bytes)}")
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        return self._connection().execute(sql, params).fetchall()
+
+    def _frame(self, sql, params=()):
+        return pd.read_sql_query(sql, self._connection(), params=params, index_col='row_id')
+
+    @staticmethod
+    def _genre_clause(selected_genres, prefix='WHERE'):
+        key = GenreIndex.normalize(selected_genres)
+        if key is None:
+            return '', []
+        return f'{prefix} "Top Genre" IN ({", ".join("?" * len(key))})', list(key)
+
+    def __len__(self):
+        return self._size
+
+    def genres(self):
+        return [genre for genre, in self._query('SELECT DISTINCT "Top Genre" FROM songs ORDER BY "Top Genre"')]
+
+    def genre_counts(self):
+        rows = self._query(
+            'SELECT "Top Genre", COUNT(*) AS n FROM songs GROUP BY "Top Genre" ORDER BY n DESC, "Top Genre"'
+        )
+        return pd.Series([n for _, n in rows], index=[genre for genre, _ in rows], name='count')
+
+    def filter(self, selected_genres, columns=None):
+        """Songs in the selected genres, in dataset order, limited to `columns` if given."""
+        where, params = self._genre_clause(selected_genres)
+        selected = ', '.join(_quote(name) for name in dict.fromkeys(columns)) if columns else '*'
+        frame = self._frame(f"SELECT row_id, {selected} FROM songs {where} ORDER BY row_id", params)
+        return frame.drop(columns='artist_code', errors='ignore')
+
+    def year_counts(self, selected_genres):
+        where, params = self._genre_clause(selected_genres)
+        rows = self._query(f"SELECT Year, COUNT(*) FROM songs {where} GROUP BY Year ORDER BY Year", params)
+        return np.array([year for year, _ in rows]), np.array([n for _, n in rows])
+
+    def yearly_mean_popularity(self, selected_genres):
+        where, params = self._genre_clause(selected_genres)
+        rows = self._query(f"SELECT Year, AVG(Popularity) FROM songs {where} GROUP BY Year ORDER BY Year", params)
+        return np.array([year for year, _ in rows]), np.array([mean for _, mean in rows])
+
+    def top_artists(self, selected_genres, n=15):
+        where, params = self._genre_clause(selected_genres)
+        rows = self._query(
+            f"SELECT Artist, COUNT(*) AS n FROM songs {where} "
+            f"GROUP BY artist_code ORDER BY n DESC, artist_code LIMIT ?",
+            params + [n]
+        )
+        return np.array([artist for artist, _ in rows], dtype=object), np.array([count for _, count in rows])
+
+    def cluster_means(self, cluster, features):
+        averages = ', '.join(f"AVG({_quote(name)})" for name in features)
+        values = self._query(f"SELECT {averages} FROM songs WHERE Cluster = ?", (int(cluster),))[0]
+        return pd.Series(values, index=features, dtype=np.float64)
+
+    def page_counts(self):
+        return {
+            int(cluster): (size + self.page_size - 1) // self.page_size
+            for cluster, size in self._cluster_sizes.items()
+        }
+
+    def cluster_page(self, cluster, page_number):
+        total_pages = (self._cluster_sizes.get(cluster, 0) + self.page_size - 1) // self.page_size
+        page_number = max(0, min(page_number or 0, total_pages - 1))
+        rows = self._query(
+            "SELECT row_id FROM songs WHERE Cluster = ? ORDER BY Popularity DESC, row_id LIMIT ? OFFSET ?",
+            (int(cluster), self.page_size, page_number * self.page_size)
+        )
+        return np.array([row for row, in rows], dtype=np.intp), page_number, total_pages
+
+    def songs(self, rows):
+        rows = [int(row) for row in rows]
+        if not rows:
+            return self._frame("SELECT * FROM songs WHERE 0").drop(columns='artist_code')
+        frame = self._frame(f"SELECT * FROM songs WHERE row_id IN ({', '.join('?' * len(rows))})", rows)
+        return frame.drop(columns='artist_code').loc[rows]
+
+    def to_client(self):
+        """Same payload as GenreCube.to_client, aggregated in SQL."""
+        genres = self.genres()
+        genre_positions = {genre: i for i, genre in enumerate(genres)}
+        years = [year for year, in self._query("SELECT DISTINCT Year FROM songs ORDER BY Year")]
+        year_positions = {year: i for i, year in enumerate(years)}
+        year_counts = np.zeros((len(genres), len(years)), dtype=np.int64)
+        for genre, year, count in self._query('SELECT "Top Genre", Year, COUNT(*) FROM songs GROUP BY 1, 2'):
+            year_counts[genre_positions[genre], year_positions[year]] = count
+
+        artists = [artist for _, artist in self._query(
+            "SELECT artist_code, MIN(Artist) FROM songs GROUP BY artist_code ORDER BY artist_code"
+        )]
+        cells = self._query('SELECT "Top Genre", artist_code, COUNT(*) FROM songs GROUP BY 1, 2')
+        artist_counts = sparse.csr_matrix(
+            ([count for _, _, count in cells],
+             ([genre_positions[genre] for genre, _, _ in cells], [code for _, code, _ in cells])),
+            shape=(len(genres), len(artists))
+        )
+        return {
+            'genres': genres,
+            'years': years,
+            'year_counts': year_counts.tolist(),
+            'artists': artists,
+            'artist_indptr': artist_counts.indptr.tolist(),
+            'artist_indices': artist_counts.indices.tolist(),
+            'artist_counts': artist_counts.data.tolist()
+        }
+
+
+def open_catalog(backend, df, cache_dir, version, page_size=10):
+    """
+    Catalog for the configured backend.
+
+    Args:
+        backend: 'pandas' (in-memory, default) or 'sqlite' (on-disk)
+        df: The dataset with its 'Cluster' column
+        cache_dir: Where the SQLite database is stored
+        version: Dataset/cluster version the database is keyed on
+        page_size: Songs per cluster page
+    """
+    if backend == 'pandas':
+        return PandasCatalog(df, page_size=page_size)
+    if backend == 'sqlite':
+        digest = hashlib.sha256(version.encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"catalog-v{CATALOG_VERSION}-{digest}.sqlite")
+        if not os.path.exists(path):
+            print(f"Building catalog database {path}")
+            SQLiteCatalog.build(df, path)
+        return SQLiteCatalog(path, page_size=page_size)
+    raise ValueError(f"Unknown catalog backend {backend!r} (expected 'pandas' or 'sqlite')")
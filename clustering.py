@@ -0,0 +1,360 @@
+"""
+Build step for the song clusters shown in "Discover Your Music Style".
+
+Fits the K-means model once and stores the cluster assignments, scaler and
+centroids in a versioned artifact, keyed by a hash of the dataset and the
+clustering parameters. The app loads the artifact instead of refitting in
+every worker and only falls back to fitting when the artifact is stale.
+
+Fitted clusters are matched to the reference centroids of the named clusters
+(see CLUSTER_NAMES), so label 0 is "Acoustic Mainstream" whatever order
+K-means happens to find the groups in.
+
+With CLUSTER_MODE=incremental (or --incremental) a changed dataset does not
+trigger a refit: the newest artifact is updated with only the songs it does
+not know yet (see update_clusters), at a cost proportional to the new songs.
+
+The nearest-neighbour index of similar songs (see similarity.py) is built
+in the same step.
+
+Usage:
+    build-clusters [--csv data/Spotify-2000.csv] [--artifact-dir artifacts] [--incremental]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from scipy.optimize import linear_sum_assignment
+from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV = os.path.join(BASE_DIR, 'data', 'Spotify-2000.csv')
+ARTIFACT_DIR = os.path.join(BASE_DIR, 'artifacts')
+
+# Bump when the artifact layout changes
+ARTIFACT_VERSION = 2
+
+# Setting up clusters from sohini's code
+CLUSTER_FEATURES = ['Artist_encoded', 'Acousticness', 'Liveness', 'Popularity']
+CLUSTER_PARAMS = {'n_clusters': 4, 'random_state': 42, 'n_init': 10}
+
+# Names shown in the dashboard, indexed by cluster label
+CLUSTER_NAMES = ["Acoustic Mainstream", "Popular Hits", "Rising Artists", "Live Performers"]
+
+# Standardized centroid (CLUSTER_FEATURES order) each name was given to, from the fit on Spotify-2000.csv
+REFERENCE_CENTROIDS = [
+    [-0.143, 1.422, -0.268, -0.174],
+    [0.923, -0.521, -0.223, 0.269],
+    [-0.928, -0.533, -0.199, -0.076],
+    [0.132, -0.065, 2.916, -0.364]
+]
+
+# 'full' refits on a changed dataset; 'incremental' assigns only the new songs (see update_clusters)
+CLUSTER_MODE = os.environ.get('CLUSTER_MODE', 'full')
+
+
+def file_hash(path):
+    """sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_key(csv_path, params=CLUSTER_PARAMS, mode='full', dataset_hash=None):
+    """
+    Key that changes whenever the dataset, the parameters, the mode or the artifact format change.
+
+    Args:
+        dataset_hash: sha256 of the CSV when the caller already knows it
+            (dataset.dataset_version remembers it), so the file is not re-hashed
+    """
+    payload = json.dumps({
+        'dataset': dataset_hash or file_hash(csv_path),
+        'params': params,
+        'mode': mode,
+        'features': CLUSTER_FEATURES,
+        'version': ARTIFACT_VERSION,
+        'sklearn': sklearn.__version__
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def artifact_path(key, artifact_dir=ARTIFACT_DIR):
+    return os.path.join(artifact_dir, f"clusters-v{ARTIFACT_VERSION}-{key}.joblib")
+
+
+def match_labels(centroids, reference=REFERENCE_CENTROIDS):
+    """
+    Map fitted cluster labels onto the named clusters.
+
+    Each centroid is paired with one reference centroid so that the summed
+    distance is smallest (Hungarian algorithm on the distance matrix).
+
+    Args:
+        centroids: Fitted centroids in standardized feature space
+        reference: Centroids the names belong to, in the same space
+
+    Returns:
+        ndarray: label_map, where label_map[fitted label] is the named label
+    """
+    centroids = np.asarray(centroids)
+    reference = np.asarray(reference)
+    if len(centroids) != len(reference):
+        # Other cluster counts have no names to keep stable
+        return np.arange(len(centroids))
+    cost = np.linalg.norm(centroids[:, None, :] - reference[None, :, :], axis=2)
+    rows, columns = linear_sum_assignment(cost)
+    label_map = np.empty(len(centroids), dtype=int)
+    label_map[rows] = columns
+    return label_map
+
+
+def _named_centroids(model, label_map):
+    centroids = np.empty_like(model.cluster_centers_)
+    centroids[label_map] = model.cluster_centers_
+    return centroids
+
+
+def encode_artists(label_encoder, extra_artists, artists):
+    """
+    Artist codes for the 'Artist_encoded' feature.
+
+    Artists the encoder was fitted on keep their code. Unseen artists are
+    added to `extra_artists` (artist -> offset) and coded after the known
+    ones, so existing codes never shift.
+
+    Returns:
+        ndarray: One code per artist
+    """
+    classes = label_encoder.classes_
+    artists = np.asarray(artists, dtype=object)
+    positions = np.searchsorted(classes, artists)
+    found = positions < len(classes)
+    found[found] = classes[positions[found]] == artists[found]
+    codes = positions.astype(np.int64)
+    for i in np.flatnonzero(~found):
+        codes[i] = len(classes) + extra_artists.setdefault(artists[i], len(extra_artists))
+    return codes
+
+
+def fit_clusters(df, params=CLUSTER_PARAMS):
+    """
+    Fit K-means on the dataset.
+
+    Args:
+        df: DataFrame with 'Artist', 'Acousticness', 'Liveness' and 'Popularity'
+            columns (and 'Song_ID', for later incremental updates)
+
+    Returns:
+        dict: Artifact with the named cluster labels, fitted encoder/scaler and centroids
+    """
+    cluster_df = df[['Artist', 'Acousticness', 'Liveness', 'Popularity']].copy()
+
+    le = LabelEncoder()
+    cluster_df['Artist_encoded'] = le.fit_transform(cluster_df['Artist'])
+
+    scaler = StandardScaler()
+    X = scaler.fit_transform(cluster_df[CLUSTER_FEATURES])
+
+    kmeans = KMeans(**params)
+    label_map = match_labels(kmeans.fit(X).cluster_centers_)
+    labels = label_map[kmeans.labels_]
+
+    return {
+        'version': ARTIFACT_VERSION,
+        'params': params,
+        'features': CLUSTER_FEATURES,
+        'labels': labels,
+        'song_ids': df['Song_ID'].to_numpy() if 'Song_ID' in df else None,
+        'label_encoder': le,
+        'extra_artists': {},
+        'scaler': scaler,
+        'centroids': _named_centroids(kmeans, label_map),
+        'label_map': label_map,
+        'model': kmeans
+    }
+
+
+def _as_minibatch(artifact):
+    """MiniBatchKMeans that starts from the artifact's centroids, weighted by the songs they hold."""
+    model = artifact['model']
+    if isinstance(model, MiniBatchKMeans):
+        return model
+    # Stored labels are named; argsort of the permutation maps them back to the model's labels
+    fitted_labels = np.argsort(artifact['label_map'])[artifact['labels']]
+    counts = np.bincount(fitted_labels, minlength=len(model.cluster_centers_))
+    minibatch = MiniBatchKMeans(
+        n_clusters=len(model.cluster_centers_),
+        init=model.cluster_centers_,
+        n_init=1,
+        # Never move a small cluster onto random songs: that would change what its name means
+        reassignment_ratio=0,
+        random_state=artifact['params'].get('random_state')
+    )
+    # One step on the centroids themselves sets the running counts without moving them
+    minibatch.partial_fit(model.cluster_centers_, sample_weight=counts.astype(float))
+    return minibatch
+
+
+def update_clusters(artifact, df):
+    """
+    Assign the songs of `df` that `artifact` has not seen, without a full refit.
+
+    The artifact's encoder and scaler are kept, so the feature space does not
+    move. The centroids take one MiniBatchKMeans partial_fit step on the new
+    songs only, weighted against the songs already in each cluster, and the
+    new songs get the label of their nearest centroid. Songs already in the
+    artifact keep their cluster, and labels are matched to the named clusters
+    again in case the centroids have moved far enough to swap.
+
+    Args:
+        artifact: Artifact from fit_clusters or update_clusters, with song ids
+        df: The whole current catalog, with a 'Song_ID' column
+
+    Returns:
+        dict: Artifact covering every song of `df`, in its row order
+    """
+    known = pd.Series(artifact['labels'], index=artifact['song_ids'])
+    known = known[~known.index.duplicated()]
+    previous_labels = known.reindex(df['Song_ID']).to_numpy()
+    is_new = np.isnan(previous_labels)
+    new = df.loc[is_new, ['Artist', 'Acousticness', 'Liveness', 'Popularity']].copy()
+
+    model = _as_minibatch(artifact)
+    extra_artists = dict(artifact['extra_artists'])
+    label_map = artifact['label_map']
+    labels = np.zeros(len(df), dtype=int)
+    labels[~is_new] = previous_labels[~is_new].astype(int)
+
+    if len(new):
+        new['Artist_encoded'] = encode_artists(artifact['label_encoder'], extra_artists, new['Artist'])
+        X = artifact['scaler'].transform(new[CLUSTER_FEATURES])
+        model.partial_fit(X)
+
+        new_map = match_labels(model.cluster_centers_)
+        if not np.array_equal(new_map, label_map):
+            # named label -> fitted label -> new named label
+            relabel = np.empty_like(label_map)
+            relabel[label_map] = new_map
+            labels[~is_new] = relabel[labels[~is_new]]
+            label_map = new_map
+        labels[is_new] = label_map[model.predict(X)]
+
+    return {
+        'version': ARTIFACT_VERSION,
+        'params': artifact['params'],
+        'features': CLUSTER_FEATURES,
+        'labels': labels,
+        'song_ids': df['Song_ID'].to_numpy(),
+        'label_encoder': artifact['label_encoder'],
+        'extra_artists': extra_artists,
+        'scaler': artifact['scaler'],
+        'centroids': _named_centroids(model, label_map),
+        'label_map': label_map,
+        'model': model
+    }
+
+
+def save_artifact(artifact, path):
+    """Write the artifact atomically so concurrent workers never read half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(artifact, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def latest_artifact(artifact_dir=ARTIFACT_DIR, params=CLUSTER_PARAMS):
+    """Most recently written artifact with these parameters that incremental updates can start from, or None."""
+    paths = glob.glob(os.path.join(artifact_dir, f"clusters-v{ARTIFACT_VERSION}-*.joblib"))
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            artifact = joblib.load(path)
+        except Exception as e:
+            print(f"Could not load cluster artifact {path}: {e}")
+            continue
+        if artifact['params'] == params and artifact.get('song_ids') is not None:
+            return artifact
+    return None
+
+
+def build_artifact(df, key, artifact_dir=ARTIFACT_DIR, params=CLUSTER_PARAMS, mode=CLUSTER_MODE):
+    """Fit (or, in incremental mode, update the latest artifact) and save the result under `key`."""
+    previous = latest_artifact(artifact_dir, params) if mode == 'incremental' else None
+    if previous is not None:
+        print(f"Assigning new songs to the clusters of artifact {previous.get('key')}")
+        artifact = update_clusters(previous, df)
+    else:
+        print("Fitting clusters (no up-to-date artifact found)")
+        artifact = fit_clusters(df, params)
+    artifact['key'] = key
+    path = artifact_path(key, artifact_dir)
+    try:
+        save_artifact(artifact, path)
+    except OSError as e:
+        print(f"Could not save cluster artifact {path}: {e}")
+    return artifact
+
+
+def load_or_fit(df, csv_path=DEFAULT_CSV, artifact_dir=ARTIFACT_DIR, params=CLUSTER_PARAMS, mode=CLUSTER_MODE,
+                dataset_hash=None):
+    """
+    Load the cluster artifact for this dataset, building (and saving) it if it is missing or stale.
+
+    Args:
+        mode: 'full' refits on a changed dataset, 'incremental' updates the latest artifact
+        dataset_hash: sha256 of the CSV (see dataset.dataset_version); hashed here if not given
+
+    Returns:
+        dict: Artifact as produced by fit_clusters, plus its 'key'
+    """
+    key = artifact_key(csv_path, params, mode, dataset_hash)
+    path = artifact_path(key, artifact_dir)
+
+    if os.path.exists(path):
+        try:
+            artifact = joblib.load(path)
+            if len(artifact['labels']) == len(df):
+                print(f"Loaded cluster artifact {path}")
+                return artifact
+            print(f"Cluster artifact {path} does not match the dataset, refitting")
+        except Exception as e:
+            print(f"Could not load cluster artifact {path}: {e}")
+
+    return build_artifact(df, key, artifact_dir, params, mode)
+
+
+def main(argv=None):
+    # dataset imports this module for file_hash
+    from dataset import dataset_version, read_csv
+    from similarity import SIMILARITY_FEATURES, load_or_build as load_similar_songs
+
+    parser = argparse.ArgumentParser(description="Fit the song clusters and store them as an artifact.")
+    parser.add_argument('--csv', default=DEFAULT_CSV, help="Dataset to cluster")
+    parser.add_argument('--artifact-dir', default=ARTIFACT_DIR, help="Where to write the artifact")
+    parser.add_argument('--incremental', action='store_true', default=CLUSTER_MODE == 'incremental',
+                        help="Only assign the songs the latest artifact does not have yet")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    df = read_csv(args.csv)
+    mode = 'incremental' if args.incremental else 'full'
+    dataset_hash = dataset_version(args.csv, args.artifact_dir)
+    key = artifact_key(args.csv, mode=mode, dataset_hash=dataset_hash)
+    build_artifact(df, key, args.artifact_dir, mode=mode)
+    print(f"Wrote {artifact_path(key, args.artifact_dir)} ({len(df)} songs) in {time.time() - start:.2f}s")
+    # The "More like this" index is stored next to the clusters so workers only load it
+    load_similar_songs(df[SIMILARITY_FEATURES], args.artifact_dir, dataset_hash)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
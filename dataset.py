@@ -0,0 +1,139 @@
+"""
+Columnar cache of the song dataset.
+
+Parsing data/Spotify-2000.csv on every process start re-reads text and leaves
+each gunicorn worker with a private copy of every column. The first load
+converts the CSV into a bundle of NumPy .npy files (one per column, string
+columns stored as categorical codes). Later loads memory-map that bundle
+read-only, so workers share the column pages through the OS page cache.
+The bundle is keyed by the CSV's sha256. The CSV's mtime and size are
+remembered so an unchanged file is not re-hashed.
+"""
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from clustering import file_hash
+from preview_index import song_id
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, 'artifacts')
+
+# Bump when the bundle layout changes
+BUNDLE_VERSION = 2
+
+# String columns kept as pandas categoricals; other text columns are rebuilt as plain strings
+CATEGORICAL_COLUMNS = ['Artist', 'Top Genre']
+
+
+def dataset_version(csv_path, cache_dir=CACHE_DIR):
+    """sha256 of the CSV, reusing the stored hash while its mtime and size are unchanged."""
+    stat = os.stat(csv_path)
+    stat_path = os.path.join(cache_dir, 'dataset-stat.json')
+    try:
+        with open(stat_path) as f:
+            known = json.load(f)
+        if known['path'] == os.path.abspath(csv_path) and known['mtime_ns'] == stat.st_mtime_ns \
+                and known['size'] == stat.st_size:
+            return known['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha256 = file_hash(csv_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{stat_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'path': os.path.abspath(csv_path),
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha256': sha256
+            }, f)
+        os.replace(tmp_path, stat_path)
+    except OSError as e:
+        print(f"Could not save dataset fingerprint: {e}")
+    return sha256
+
+
+def read_csv(csv_path):
+    """Parse the CSV with the cleaning the notebooks do by hand, plus a stable 'Song_ID' per row."""
+    df = pd.read_csv(csv_path)
+    if df['Length (Duration)'].dtype == object:
+        df['Length (Duration)'] = df['Length (Duration)'].str.replace(',', '').astype('int64')
+    df['Song_ID'] = [song_id(title, artist) for title, artist in zip(df['Title'], df['Artist'])]
+    return df
+
+
+def _write_bundle(df, bundle_dir):
+    tmp_dir = f"{bundle_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        filename = f"col{i}.npy"
+        series = df[name]
+        if series.dtype == object:
+            categorical = pd.Categorical(series)
+            codes = categorical.codes.astype(np.int32)
+            np.save(os.path.join(tmp_dir, filename), codes)
+            columns.append({
+                'name': name,
+                'file': filename,
+                'kind': 'category' if name in CATEGORICAL_COLUMNS else 'string',
+                'categories': categorical.categories.tolist()
+            })
+        else:
+            np.save(os.path.join(tmp_dir, filename), series.to_numpy())
+            columns.append({'name': name, 'file': filename, 'kind': 'numeric'})
+
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({'version': BUNDLE_VERSION, 'rows': len(df), 'columns': columns}, f)
+
+    try:
+        os.rename(tmp_dir, bundle_dir)
+    except OSError:
+        # Another worker finished the same bundle first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _read_bundle(bundle_dir):
+    with open(os.path.join(bundle_dir, 'meta.json')) as f:
+        meta = json.load(f)
+
+    data = {}
+    for column in meta['columns']:
+        values = np.load(os.path.join(bundle_dir, column['file']), mmap_mode='r')
+        if column['kind'] == 'category':
+            data[column['name']] = pd.Categorical.from_codes(values, column['categories'])
+        elif column['kind'] == 'string':
+            data[column['name']] = np.asarray(column['categories'], dtype=object)[values]
+        else:
+            data[column['name']] = values
+    # copy=False keeps the numeric columns as read-only views of the mapped files
+    return pd.DataFrame(data, copy=False)
+
+
+def load_dataset(csv_path, cache_dir=CACHE_DIR):
+    """
+    Load the dataset, building the columnar cache first if needed.
+
+    Returns:
+        DataFrame: The dataset with 'Length (Duration)' as integers and
+        'Artist'/'Top Genre' as categoricals
+    """
+    try:
+        sha256 = dataset_version(csv_path, cache_dir)
+        bundle_dir = os.path.join(cache_dir, f"dataset-v{BUNDLE_VERSION}-{sha256[:16]}")
+        if not os.path.exists(os.path.join(bundle_dir, 'meta.json')):
+            print(f"Building dataset cache {bundle_dir}")
+            _write_bundle(read_csv(csv_path), bundle_dir)
+        return _read_bundle(bundle_dir)
+    except Exception as e:
+        print(f"Dataset cache unavailable, reading CSV directly: {e}")
+        df = read_csv(csv_path)
+        for name in CATEGORICAL_COLUMNS:
+            df[name] = df[name].astype('category')
+        return df
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def grid_downsample(x, y, max_points, bins=100, seed=0):
+    """
+    Density-aware subset of scatter points.
+
+    Points are bucketed on a bins x bins grid and every cell keeps at most the
+    same number of points, picked at random (with a fixed seed, so cached
+    figures stay stable). Sparse cells and outliers are kept in full while
+    dense clusters are thinned, which preserves the shape of the cloud.
+
+    Args:
+        x, y: Point coordinates
+        max_points: Upper bound on the number of points returned
+        bins: Grid resolution per axis
+
+    Returns:
+        np.ndarray: Sorted positions of the points to keep
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+
+    def bin_of(values):
+        low, high = np.nanmin(values), np.nanmax(values)
+        scaled = (values - low) / ((high - low) or 1.0) * bins
+        return np.clip(np.nan_to_num(scaled).astype(np.int64), 0, bins - 1)
+
+    cells = bin_of(x) * bins + bin_of(y)
+
+    # Rank every point inside its cell in a random order
+    order = np.random.default_rng(seed).permutation(n)
+    by_cell = order[np.argsort(cells[order], kind='stable')]
+    sorted_cells = cells[by_cell]
+    first_in_cell = np.searchsorted(sorted_cells, sorted_cells, side='left')
+    ranks = np.arange(n) - first_in_cell
+
+    # Largest per-cell quota that stays within max_points
+    counts = np.sort(np.bincount(cells)[np.bincount(cells) > 0])
+    low, high = 1, int(counts[-1])
+    while low < high:
+        quota = (low + high + 1) // 2
+        if np.minimum(counts, quota).sum() <= max_points:
+            low = quota
+        else:
+            high = quota - 1
+
+    keep = by_cell[ranks < low]
+    if len(keep) > max_points:
+        # More occupied cells than max_points: one random point from a random subset of cells
+        keep = np.random.default_rng(seed).choice(keep, max_points, replace=False)
+    return np.sort(keep)
+
+
+def discrete_colorscale(colors):
+    """Step colorscale mapping the integers 0..len(colors)-1 to `colors` (use with cmin=-0.5, cmax=len-0.5)."""
+    n = len(colors)
+    if n == 1:
+        return [[0, colors[0]], [1, colors[0]]]
+    scale = []
+    for i, color in enumerate(colors):
+        scale.append([i / n, color])
+        scale.append([(i + 1) / n, color])
+    return scale
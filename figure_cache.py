@@ -0,0 +1,92 @@
+import functools
+import json
+import os
+import threading
+from collections import OrderedDict
+import plotly.io as pio
+
+FIGURE_CACHE_BYTES = int(os.environ.get('FIGURE_CACHE_BYTES', 64 * 1024 * 1024))
+
+
+def _freeze(value):
+    """Hashable form of a callback input (dropdown values arrive as lists)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class FigureCache:
+    """
+    Size-bounded LRU of serialized Plotly figures for deterministic callbacks.
+
+    Entries are keyed on the callback name, its normalized inputs and the
+    current data version, so a new dataset or cluster artifact never serves
+    figures built from the old one.
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def set_version(self, version):
+        """Switch to a new data version, dropping every cached figure."""
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+                self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get((self.version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((self.version, key))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, figure):
+        """Serialize a figure, store it and return the stored (plain JSON) form."""
+        data = pio.to_json(figure, validate=False)
+        stored = json.loads(data)
+        size = len(data)
+        if size > self.max_bytes:
+            return stored
+        with self._lock:
+            full_key = (self.version, key)
+            if full_key in self._entries:
+                self._bytes -= self._entries.pop(full_key)[1]
+            self._entries[full_key] = (stored, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+        return stored
+
+    def cached(self, name, key=None):
+        """
+        Decorator memoizing a figure-returning callback.
+
+        Args:
+            name: Callback name used in the cache key
+            key: Optional function mapping the callback arguments to a hashable key
+                 (e.g. to sort genre selections); defaults to the frozen arguments
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                cache_key = (name, key(*args) if key else _freeze(args))
+                figure = self.get(cache_key)
+                if figure is None:
+                    figure = self.put(cache_key, func(*args))
+                return figure
+            return wrapper
+        return decorator
@@ -0,0 +1,14 @@
+"""
+gunicorn settings, read from the working directory (`gunicorn app:server`).
+
+Workers write their metrics snapshots to METRICS_DIR (see metrics.py). The
+master clears the snapshots of the previous run before forking, so counters
+start from zero with every deployment instead of adding up across restarts.
+"""
+import metrics
+
+
+def on_starting(server):
+    # Only the dashboard owns the metrics directory, not e.g. the standalone preview server
+    if (server.app.app_uri or '').startswith('app:'):
+        metrics.registry.clear()
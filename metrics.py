@@ -0,0 +1,275 @@
+"""
+Process-shared counters and latency histograms exposed in Prometheus text format.
+
+Each gunicorn worker keeps its metrics in memory and regularly writes a
+snapshot to METRICS_DIR/metrics-<pid>-<start time>.json. The /metrics route
+sums the snapshots of every worker, so a scrape sees the whole server
+whichever worker answers it. Snapshots of workers that have exited are
+kept, so counters never go backwards, and the start time keeps a new
+worker that reuses an old pid from overwriting its predecessor's file.
+The gunicorn master clears the directory when it starts (gunicorn.conf.py),
+so every deployment starts from zero. Only processes serving /metrics write
+snapshots (init_app enables them), so command-line tools and benchmarks that
+import the preview code never add their counts to the dashboard's.
+"""
+import functools
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dash.exceptions import PreventUpdate
+from flask import Response, g, has_request_context, request
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'spotify-dashboard-metrics'))
+# Seconds between snapshot writes of a worker (a scrape always writes the answering worker's first)
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    """
+    Named counters and histograms, each with any number of label sets.
+
+    Metrics are declared once with `describe`; `inc` and `observe` then
+    record samples. Collectors registered with `add_collector` report
+    counters kept elsewhere (e.g. the figure cache hit counts) at flush time.
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL, enabled=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # Samples are always recorded in memory; snapshots are only written once enabled
+        self.enabled = enabled
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._last_flush = 0.0
+        self._pid = None
+        self._snapshot_name = None
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text, buckets=None):
+        """Declare a 'counter' or 'histogram' (with its bucket upper bounds)."""
+        self._meta[name] = {'kind': kind, 'help': help_text, 'buckets': list(buckets or ())}
+
+    def add_collector(self, collect):
+        """Register a function returning [(counter name, labels dict, value)] read at every flush."""
+        self._collectors.append(collect)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name]['buckets']
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time of a block in the histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [
+                [name, list(labels), list(h['counts']), h['sum'], h['count']]
+                for (name, labels), h in self._histograms.items()
+            ]
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    counters.append([name, list(_labels_key(labels)), value])
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return {'counters': counters, 'histograms': histograms}
+
+    def _snapshot_path(self):
+        # Named when first written in this process, so forked workers each get their own start time
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._snapshot_name = f"metrics-{self._pid}-{time.time_ns()}.json"
+        return os.path.join(self.directory, self._snapshot_name)
+
+    def flush(self):
+        """Write this process's snapshot for the other workers to aggregate (no-op until enabled)."""
+        self._last_flush = time.monotonic()
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._snapshot_path()
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write metrics snapshot: {e}")
+
+    def _maybe_flush(self):
+        if self.enabled and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def clear(self):
+        """Delete every snapshot in the directory; call before any worker starts."""
+        removed = 0
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+        if removed:
+            print(f"Cleared {removed} metrics snapshots from {self.directory}")
+        return removed
+
+    def aggregate(self):
+        """Sum the snapshots of every worker that has written one."""
+        self.flush()
+        counters, histograms = {}, {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, {'counts': [0] * len(counts), 'sum': 0.0, 'count': 0})
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], counts)]
+                merged['sum'] += total
+                merged['count'] += count
+        return counters, histograms
+
+    def render(self):
+        """All workers' metrics in the Prometheus text exposition format."""
+        counters, histograms = self.aggregate()
+        lines = []
+        for name in sorted({name for name, _ in counters} | {name for name, _ in histograms}):
+            meta = self._meta.get(name, {'kind': 'counter', 'help': '', 'buckets': []})
+            lines.append(f"# HELP {name} {meta['help']}")
+            lines.append(f"# TYPE {name} {meta['kind']}")
+            if meta['kind'] == 'histogram':
+                for (sample_name, labels), h in sorted(histograms.items()):
+                    if sample_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(meta['buckets'], h['counts']):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_number(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {h['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(h['sum'])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {h['count']}")
+            else:
+                for (sample_name, labels), value in sorted(counters.items()):
+                    if sample_name == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+registry.describe('dash_callback_duration_seconds', 'histogram',
+                  'Wall time of Dash callbacks.', DURATION_BUCKETS)
+registry.describe('dash_callback_calls_total', 'counter', 'Dash callback invocations.')
+registry.describe('dash_callback_errors_total', 'counter', 'Dash callbacks that raised an error.')
+registry.describe('dash_callback_response_bytes', 'histogram',
+                  'Size of Dash callback responses sent to the browser.', BYTES_BUCKETS)
+registry.describe('preview_lookups_total', 'counter',
+                  'Songs looked up by the preview resolver, by outcome (cached, known_missing and known_error are answered without a search).')
+registry.describe('preview_resolve_duration_seconds', 'histogram',
+                  'Wall time of resolving one batch of previews.', DURATION_BUCKETS)
+registry.describe('deezer_request_duration_seconds', 'histogram',
+                  'Latency of Deezer searches and preview downloads.', DURATION_BUCKETS)
+registry.describe('deezer_request_errors_total', 'counter', 'Failed Deezer searches and preview downloads.')
+registry.describe('figure_cache_hits_total', 'counter', 'Figure cache hits.')
+registry.describe('figure_cache_misses_total', 'counter', 'Figure cache misses.')
+
+
+def instrument_callback(func, name=None):
+    """
+    Wrap a Dash callback to record its wall time, calls and errors.
+
+    PreventUpdate is control flow, not an error. The callback name is kept
+    on flask.g so the response size can be attributed to it (see init_app).
+    """
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if has_request_context():
+            g.callback_name = name
+        registry.inc('dash_callback_calls_total', callback=name)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            registry.inc('dash_callback_errors_total', callback=name)
+            raise
+        finally:
+            registry.observe('dash_callback_duration_seconds', time.perf_counter() - start, callback=name)
+
+    return wrapper
+
+
+def init_app(server):
+    """Record callback response sizes, serve /metrics on a Flask server and start writing snapshots."""
+    registry.enabled = True
+
+    @server.after_request
+    def record_response_bytes(response):
+        if request.path.endswith('/_dash-update-component'):
+            size = response.calculate_content_length()
+            if size is not None:
+                registry.observe('dash_callback_response_bytes', size, callback=g.get('callback_name', 'unknown'))
+        return response
+
+    @server.route('/metrics')
+    def serve_metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+
+# How long a "no preview on Deezer" result is trusted before searching again
+MISSING_TTL = float(os.environ.get('PREVIEW_MISSING_TTL', 7 * 24 * 3600))
+# How long a failed search or download is backed off before the song is tried again
+ERROR_TTL = float(os.environ.get('PREVIEW_ERROR_TTL', 300))
+
+
+def song_id(title, artist):
+    """
+    Stable identifier of a song: a short hash of its title and artist.
+
+    Used as the key of the preview index, the preview file name and the
+    preview-paths store, so songs sharing a title never collide and file
+    names stay ASCII whatever characters the title contains.
+    """
+    text = unicodedata.normalize('NFC', f"{title}\x1f{artist}")
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class PreviewIndex:
+    """
+    Persistent song id -> resolved preview lookup stored as JSON lines.
+
+    Every resolution is appended as one line, so concurrent gunicorn workers can
+    share the file; the last line for a song wins. Each entry holds the Deezer
+    track id, preview URL, local path and size, status ('ok', 'missing' or
+    'error') and the time it was checked. The file is compacted on load once
+    it holds mostly superseded lines.
+    """
+
+    def __init__(self, path, missing_ttl=MISSING_TTL, error_ttl=ERROR_TTL):
+        self.path = path
+        self.missing_ttl = missing_ttl
+        self.error_ttl = error_ttl
+        self._entries = {}
+        self._offset = 0
+        self._lines = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh()
+            self._compact()
+
+    def _read_lines(self, lines):
+        for line in lines:
+            self._lines += 1
+            try:
+                entry = json.loads(line)
+                if 'song_id' not in entry:
+                    # Written before songs had ids
+                    entry['song_id'] = song_id(entry['title'], entry['artist'])
+                self._entries[entry['song_id']] = entry
+            except (ValueError, KeyError):
+                # Torn or foreign line, skip it
+                continue
+
+    def _refresh(self):
+        """Pick up lines appended by this or other processes since the last read."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < self._offset:
+            # File was compacted by another process, start over
+            self._entries = {}
+            self._offset = 0
+            self._lines = 0
+        if size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Only consume complete lines, a writer may be mid-append
+        end = data.rfind(b'\n') + 1
+        self._read_lines(data[:end].decode('utf-8', errors='replace').splitlines())
+        self._offset += end
+
+    def _compact(self):
+        if self._lines < 100 or self._lines < 2 * len(self._entries):
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_path, self.path)
+        self._offset = os.path.getsize(self.path)
+        self._lines = len(self._entries)
+
+    def get(self, song_id):
+        """Return the stored entry for a song, or None."""
+        with self._lock:
+            self._refresh()
+            return self._entries.get(song_id)
+
+    def lookup(self, song_id):
+        """
+        Check whether a song can be answered without touching the network.
+
+        Returns:
+            tuple: ('ok', path) for a preview on disk, ('missing', None) for a
+            known-missing song still inside its TTL, ('error', None) for a
+            song that failed to resolve within the last error TTL, or
+            (None, None) if the song needs to be resolved
+        """
+        entry = self.get(song_id)
+        if entry is None:
+            return None, None
+        if entry['status'] == 'ok' and entry.get('path'):
+            try:
+                size = os.path.getsize(entry['path'])
+            except OSError:
+                # Evicted or deleted, resolve again
+                return None, None
+            if entry.get('bytes') in (None, size):
+                return 'ok', entry['path']
+            return None, None
+        if entry['status'] == 'missing' and time.time() - entry['checked_at'] < self.missing_ttl:
+            return 'missing', None
+        if entry['status'] == 'error' and time.time() - entry['checked_at'] < self.error_ttl:
+            return 'error', None
+        return None, None
+
+    def expected_sizes(self):
+        """Song id -> size of its preview file as recorded when it was downloaded."""
+        with self._lock:
+            self._refresh()
+            return {
+                song: entry['bytes'] for song, entry in self._entries.items()
+                if entry['status'] == 'ok' and entry.get('bytes') is not None
+            }
+
+    def record(self, song_id, title, artist, status, track_id=None, preview_url=None, path=None, bytes=None):
+        """Store the resolution result for a song and append it to disk."""
+        entry = {
+            'song_id': song_id,
+            'title': str(title),
+            'artist': str(artist),
+            'status': status,
+            'track_id': track_id,
+            'preview_url': preview_url,
+            'path': path,
+            'bytes': bytes,
+            'checked_at': time.time()
+        }
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._refresh()
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            # The offset is left alone so the next refresh re-reads this line
+            # together with anything other workers appended around it
+            self._entries[song_id] = entry
+        return entry
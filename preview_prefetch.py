@@ -0,0 +1,151 @@
+import itertools
+import os
+import queue
+import threading
+from collections import OrderedDict
+from audio_preview import audio_previews
+
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))
+PREFETCH_QUEUE_SIZE = int(os.environ.get('PREFETCH_QUEUE_SIZE', 32))
+# Sessions whose active group is remembered; the least recently active are forgotten first
+PREFETCH_MAX_SESSIONS = int(os.environ.get('PREFETCH_MAX_SESSIONS', 1024))
+
+# Lower runs first: the page on screen before pages the user may open next
+PRIORITY_VISIBLE = 0
+PRIORITY_PREFETCH = 1
+
+
+class PreviewPrefetcher:
+    """
+    Background worker pool that resolves previews off the request path.
+
+    Jobs sit in a bounded priority queue, so the page a user is looking at is
+    resolved before pages queued speculatively. When the queue is full new
+    jobs are dropped rather than blocking the callback that submitted them
+    (callbacks resubmit pages that are still incomplete). Each job can belong to a
+    group (the cluster it was queued for) of a session (the browser tab that
+    queued it): when a session switches its active group, its queued jobs of
+    every other group are cancelled. Other sessions' jobs, and jobs without a
+    group (the visible page, the startup warm-up), always run.
+    """
+
+    def __init__(self, resolve=audio_previews, workers=PREFETCH_WORKERS, max_queue=PREFETCH_QUEUE_SIZE,
+                 max_sessions=PREFETCH_MAX_SESSIONS):
+        self.resolve = resolve
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._order = itertools.count()
+        self._pending = {}
+        self._active_groups = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        # Threads start with the first submitted job rather than in the constructor
+        # (app.py queues its startup warm-up at import, which starts them there)
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"preview-prefetch-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            _, seq, key, songs_df, group, session = self._queue.get()
+            try:
+                with self._lock:
+                    cancelled = self._cancelled(group, session)
+                if cancelled:
+                    print(f"Skipping cancelled prefetch {key}")
+                else:
+                    print(f"Prefetching previews for {key}")
+                    self.resolve(songs_df)
+            except Exception as e:
+                print(f"Error prefetching {key}: {e}")
+            finally:
+                with self._lock:
+                    self._release(key, session, seq)
+                self._queue.task_done()
+
+    def _release(self, key, session, seq):
+        # A newer job for the same key and session (e.g. re-queued at a higher priority) keeps its marker
+        pending = self._pending.get((key, session))
+        if pending is not None and pending[1] == seq:
+            del self._pending[(key, session)]
+
+    def _cancelled(self, group, session):
+        # Sessions that were forgotten (or never switched) cancel nothing
+        return group is not None and session in self._active_groups and group != self._active_groups[session]
+
+    def set_active_group(self, group, session=None):
+        """Cancel the session's queued jobs that belong to any other group."""
+        with self._lock:
+            if session in self._active_groups:
+                self._active_groups.move_to_end(session)
+                if self._active_groups[session] == group:
+                    return
+            self._active_groups[session] = group
+            while len(self._active_groups) > self.max_sessions:
+                self._active_groups.popitem(last=False)
+
+            # Free the queue slots held by cancelled jobs right away
+            kept = []
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                _, seq, key, _, job_group, job_session = job
+                if not self._cancelled(job_group, job_session):
+                    kept.append(job)
+                else:
+                    self._release(key, job_session, seq)
+                self._queue.task_done()
+            for job in kept:
+                self._queue.put_nowait(job)
+
+    def submit(self, key, songs_df, group=None, priority=PRIORITY_PREFETCH, session=None):
+        """
+        Queue a page of songs for background resolution.
+
+        Args:
+            key: Identifies the job, e.g. (cluster, page); duplicates from the same
+                session are ignored unless they raise the job's priority
+            songs_df: DataFrame with 'Title' and 'Artist' columns
+            group: Group the job is cancelled with, None to never cancel it
+            priority: PRIORITY_VISIBLE or PRIORITY_PREFETCH
+            session: Session whose set_active_group calls can cancel the job
+
+        Returns:
+            bool: True if the job was queued
+        """
+        # Markers are per session, so one session's cancelled job never hides another's
+        marker = (key, session)
+        with self._lock:
+            previous = self._pending.get(marker)
+            if previous is not None and previous[0] <= priority:
+                return False
+            seq = next(self._order)
+            self._pending[marker] = (priority, seq)
+            self._start()
+        try:
+            self._queue.put_nowait((priority, seq, key, songs_df, group, session))
+            return True
+        except queue.Full:
+            with self._lock:
+                if previous is None:
+                    self._pending.pop(marker, None)
+                else:
+                    self._pending[marker] = previous
+            return False
+
+    def is_pending(self, key, session=None):
+        """True while a job for `key` submitted by `session` is queued or running."""
+        with self._lock:
+            return (key, session) in self._pending
+
+    def join(self):
+        """Block until every queued job has been processed."""
+        self._queue.join()
@@ -0,0 +1,149 @@
+"""
+HTTP serving of downloaded audio previews.
+
+Preview files are named after their song id, which hashes title and artist,
+not the audio: after an eviction the song is downloaded again and may come
+back with different bytes. Preview URLs therefore carry a version of the
+file's content (`?v=`, see preview_url). Responses to the current version get a year-long
+immutable Cache-Control, so browsers stop re-fetching them; a replaced file
+gets a new URL. Requests without (or with an outdated) version are answered
+with `no-cache`, so browsers revalidate them against the strong ETag. Range
+requests are answered with 206 partial content so the audio element can seek.
+
+The previews can be served in three ways:
+- by the dashboard itself (the blueprint is registered on the Dash server)
+- by a separate process, so audio downloads do not take gunicorn workers away
+  from callbacks: `gunicorn 'preview_server:create_app()' --bind :8051` and
+  point PREVIEW_BASE_URL at it
+- by the front proxy: with PREVIEW_ACCEL_REDIRECT set (nginx) or
+  PREVIEW_X_SENDFILE=1 (Apache/lighttpd) the worker only checks the file and
+  the proxy streams the bytes
+"""
+import hashlib
+import os
+import re
+import threading
+from flask import Blueprint, Flask, Response, abort, request
+from werkzeug.utils import send_file
+from audio_preview import DOWNLOAD_DIR, get_store, preview_filepath
+
+PREVIEW_CACHE_MAX_AGE = int(os.environ.get('PREVIEW_CACHE_MAX_AGE', 365 * 24 * 3600))
+
+# Internal nginx location the previews directory is aliased to, e.g. /_previews/
+PREVIEW_ACCEL_REDIRECT = os.environ.get('PREVIEW_ACCEL_REDIRECT')
+PREVIEW_X_SENDFILE = os.environ.get('PREVIEW_X_SENDFILE', '0') == '1'
+
+SONG_ID_PATTERN = re.compile(r'^[0-9a-f]{16}$')
+
+_etags = {}
+_etags_lock = threading.Lock()
+
+
+def file_etag(path):
+    """
+    Strong ETag of a file: sha1 of its content.
+
+    Hashes are remembered per (path, mtime, size), so each file is read once
+    until it is replaced.
+
+    Raises:
+        OSError: If the file does not exist
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _etags_lock:
+        known = _etags.get(path)
+    if known and known[0] == key:
+        return known[1]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+    with _etags_lock:
+        _etags[path] = (key, etag)
+    return etag
+
+
+def file_version(path):
+    """
+    Token that changes only when a preview's bytes change: a prefix of its ETag.
+
+    Timestamps are left out on purpose, since serving a preview touches it.
+
+    Raises:
+        OSError: If the file does not exist
+    """
+    return file_etag(path)[:16]
+
+
+def preview_url(base_url, song_id, path):
+    """URL of a song's preview, versioned by the file at `path` so browsers may cache it forever."""
+    try:
+        return f"{base_url}/{song_id}.mp3?v={file_version(path)}"
+    except OSError:
+        return f"{base_url}/{song_id}.mp3"
+
+
+def create_blueprint(download_dir=DOWNLOAD_DIR, url_prefix='/audio_previews'):
+    """
+    Blueprint serving `<url_prefix>/<song_id>.mp3` from the preview directory.
+
+    Args:
+        download_dir: Directory the preview files are stored in
+        url_prefix: URL path the previews are served under
+    """
+    blueprint = Blueprint('audio_previews', __name__, url_prefix=url_prefix)
+    download_dir = os.path.abspath(download_dir)
+
+    @blueprint.route('/<song_id>.mp3')
+    def serve_preview(song_id):
+        # Ids are hex, which also rules out any path traversal
+        if not SONG_ID_PATTERN.match(song_id):
+            abort(404)
+        filepath = preview_filepath(song_id, download_dir)
+        try:
+            etag = file_etag(filepath)
+            # Only a URL naming this exact file may be cached without revalidation
+            versioned = request.args.get('v') == file_version(filepath)
+        except OSError:
+            abort(404)
+        # Keeps previews that are still being played out of the eviction queue
+        get_store(download_dir).touch(song_id)
+
+        if PREVIEW_ACCEL_REDIRECT:
+            # nginx answers the range request from its internal location
+            response = Response(mimetype='audio/mpeg')
+            response.headers['X-Accel-Redirect'] = f"{PREVIEW_ACCEL_REDIRECT.rstrip('/')}/{song_id}.mp3"
+            response.set_etag(etag)
+            response.make_conditional(request)
+        else:
+            response = send_file(
+                filepath,
+                request.environ,
+                mimetype='audio/mpeg',
+                etag=etag,
+                conditional=True,
+                max_age=PREVIEW_CACHE_MAX_AGE if versioned else 0,
+                use_x_sendfile=PREVIEW_X_SENDFILE
+            )
+            response.accept_ranges = 'bytes'
+
+        response.cache_control.public = True
+        if versioned:
+            response.cache_control.max_age = PREVIEW_CACHE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = None
+            response.cache_control.no_cache = True
+        return response
+
+    return blueprint
+
+
+def create_app(download_dir=DOWNLOAD_DIR):
+    """Standalone WSGI app serving only the previews (see the module docstring)."""
+    app = Flask(__name__)
+    app.register_blueprint(create_blueprint(download_dir))
+    return app
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+
+# Disk budget for downloaded previews; least recently used files are evicted past it.
+# The default holds a fully warmed Spotify-2000 cache (about 1 GB of 30 s previews) with room to spare.
+PREVIEW_CACHE_BYTES = int(os.environ.get('PREVIEW_CACHE_BYTES', 2 * 1024 * 1024 * 1024))
+
+# Temp files older than this are left over from a crashed download, not one in progress
+STALE_PART_SECONDS = 600
+
+PART_SUFFIX = '.part'
+
+
+class IncompleteDownload(IOError):
+    """A preview download ended before the announced number of bytes arrived."""
+
+
+class PreviewStore:
+    """
+    Size-bounded directory of preview files.
+
+    Files are written to a temp file and renamed into place once complete, so
+    a failed download never leaves a partial .mp3 behind. Every read touches
+    the file's access time (explicitly, so relatime/noatime mounts do not
+    matter), and once the directory grows past `max_bytes` the least recently
+    accessed previews are deleted. The preview index then sees the file gone
+    and resolves the song again on its next request.
+    """
+
+    def __init__(self, directory, max_bytes=PREVIEW_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._files())
+
+    def path(self, song_id):
+        return os.path.join(self.directory, f"{song_id}.mp3")
+
+    def _files(self):
+        """(path, size, access time) of every stored preview."""
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.mp3'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.path, stat.st_size, stat.st_atime))
+        return files
+
+    def total_bytes(self):
+        """Bytes of previews currently stored."""
+        with self._lock:
+            return self._bytes
+
+    def touch(self, song_id):
+        """Mark a preview as just used. Returns False if it is not stored."""
+        path = self.path(song_id)
+        try:
+            # Nanosecond times keep the mtime exactly as it was
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+            return True
+        except OSError:
+            return False
+
+    def write(self, song_id, chunks, expected_bytes=None):
+        """
+        Store a preview from an iterable of byte chunks.
+
+        Args:
+            song_id: Id the preview is stored under
+            chunks: Iterable of bytes (e.g. response.iter_content())
+            expected_bytes: Announced length; a shorter or longer body is rejected
+
+        Returns:
+            tuple: (path, size in bytes)
+
+        Raises:
+            IncompleteDownload: If the body length does not match expected_bytes
+        """
+        path = self.path(song_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{PART_SUFFIX}"
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            if size == 0 or (expected_bytes is not None and size != expected_bytes):
+                raise IncompleteDownload(f"got {size} of {expected_bytes} bytes for {song_id}")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self._bytes += size
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+        return path, size
+
+    def evict(self):
+        """Delete least recently accessed previews until the store fits its budget."""
+        with self._lock:
+            files = sorted(self._files(), key=lambda f: f[2])
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for path, size, _ in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._bytes = total
+        if removed:
+            print(f"Evicted {removed} previews, {total / 1024 / 1024:.1f} MB left in {self.directory}")
+        return removed
+
+    def reconcile(self, expected_sizes):
+        """
+        Drop leftovers of interrupted downloads and truncated previews.
+
+        Args:
+            expected_sizes: Dict of song id -> size recorded when the preview
+                was downloaded (previews without a recorded size are only
+                dropped when empty)
+
+        Returns:
+            int: Number of files removed
+        """
+        removed = 0
+        now = time.time()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith(PART_SUFFIX):
+                        stale = now - stat.st_mtime > STALE_PART_SECONDS
+                    elif entry.name.endswith('.mp3'):
+                        expected = expected_sizes.get(entry.name[:-len('.mp3')])
+                        stale = stat.st_size == 0 or (expected is not None and stat.st_size != expected)
+                    else:
+                        continue
+                    if stale:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+        with self._lock:
+            self._bytes = sum(size for _, size, _ in self._files())
+        if removed:
+            print(f"Removed {removed} incomplete previews from {self.directory}")
+        return removed
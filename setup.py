@@ -4,6 +4,22 @@ setup(
     name="june_code_pudding",
     version="0.1",
     packages=find_packages(),
+    py_modules=[
+        'app',
+        'audio_preview',
+        'catalog',
+        'clustering',
+        'dataset',
+        'downsample',
+        'figure_cache',
+        'metrics',
+        'preview_index',
+        'preview_prefetch',
+        'preview_server',
+        'preview_store',
+        'similarity',
+        'warm_previews'
+    ],
     include_package_data=True,
     install_requires=[
         'dash',
@@ -15,5 +31,11 @@ setup(
         'deezer-python',
         'librosa',
         'gunicorn'
-    ]
+    ],
+    entry_points={
+        'console_scripts': [
+            'warm-previews=warm_previews:main',
+            'build-clusters=clustering:main'
+        ]
+    }
 ) 
\ No newline at end of file
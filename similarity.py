@@ -0,0 +1,138 @@
+"""
+Nearest-neighbour index behind the "More Like This" panel.
+
+Songs are compared on their standardized audio features (SIMILARITY_FEATURES),
+so a beat per minute weighs as much as a point of energy relative to how much
+each varies across the catalog. The index is built once per dataset and saved
+next to the cluster artifact; workers load it instead of rebuilding it.
+
+Catalogs up to BRUTE_FORCE_MAX_ROWS songs are searched with one vectorized
+distance computation over the memory-mapped feature matrix, which takes well
+under a millisecond at that size. Larger catalogs get a KD-tree.
+"""
+import hashlib
+import os
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+
+# Bump when the index layout changes
+INDEX_VERSION = 1
+
+SIMILARITY_FEATURES = [
+    'Beats Per Minute (BPM)', 'Energy', 'Danceability', 'Loudness (dB)',
+    'Liveness', 'Valence', 'Acousticness', 'Speechiness'
+]
+
+# Above this many songs queries go through a KD-tree instead of brute force
+BRUTE_FORCE_MAX_ROWS = int(os.environ.get('SIMILAR_BRUTE_FORCE_MAX_ROWS', 50000))
+
+
+class SimilarSongs:
+    """
+    Top-k most similar songs by Euclidean distance on standardized features.
+
+    Rows are the catalog's row ids (dataset order), so query results can be
+    passed straight to catalog.songs.
+    """
+
+    def __init__(self, X, tree=None):
+        self.X = X
+        self.tree = tree
+
+    @classmethod
+    def build(cls, features, brute_force_max_rows=BRUTE_FORCE_MAX_ROWS):
+        """
+        Standardize the feature columns and index them.
+
+        Args:
+            features: DataFrame with the SIMILARITY_FEATURES columns, in catalog row order
+            brute_force_max_rows: Largest catalog searched without a KD-tree
+        """
+        X = features[SIMILARITY_FEATURES].to_numpy(dtype=np.float64)
+        std = X.std(axis=0)
+        # A constant feature cannot tell songs apart; keep it at zero instead of dividing by zero
+        std[std == 0] = 1.0
+        X = ((X - X.mean(axis=0)) / std).astype(np.float32)
+        tree = KDTree(X) if len(X) > brute_force_max_rows else None
+        return cls(X, tree)
+
+    def __len__(self):
+        return len(self.X)
+
+    def query(self, row, k=5):
+        """
+        The `k` songs nearest to the song at `row`, nearest first, without the song itself.
+
+        Returns:
+            tuple: (row ids, distances) as arrays
+        """
+        row = int(row)
+        k = min(k, len(self.X) - 1)
+        if k <= 0:
+            return np.array([], dtype=np.intp), np.array([])
+
+        if self.tree is not None:
+            distances, rows = self.tree.query(self.X[row:row + 1], k=k + 1)
+            rows, distances = rows[0], distances[0]
+        else:
+            distances = np.sqrt(((self.X - self.X[row]) ** 2).sum(axis=1))
+            rows = np.argpartition(distances, k)[:k + 1]
+            rows = rows[np.argsort(distances[rows], kind='stable')]
+            distances = distances[rows]
+
+        # Duplicates at distance 0 may come before the song itself
+        keep = rows != row
+        return rows[keep][:k].astype(np.intp), distances[keep][:k]
+
+    def save(self, path):
+        """Write the index atomically so concurrent workers never read half a file."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump({
+            'version': INDEX_VERSION,
+            'features': SIMILARITY_FEATURES,
+            'X': self.X,
+            'tree': self.tree
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index; the feature matrix is memory-mapped and shared by the workers."""
+        state = joblib.load(path, mmap_mode='r')
+        return cls(state['X'], state['tree'])
+
+
+def index_path(cache_dir, version):
+    digest = hashlib.sha256(version.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"similar-v{INDEX_VERSION}-{digest}.joblib")
+
+
+def load_or_build(features, cache_dir, version):
+    """
+    Load the index for this dataset version, building (and saving) it if it is missing.
+
+    Args:
+        features: DataFrame with the SIMILARITY_FEATURES columns, in catalog row order
+        cache_dir: Where the index is stored (the artifact directory)
+        version: Dataset version the index is keyed on
+    """
+    path = index_path(cache_dir, version)
+    if os.path.exists(path):
+        try:
+            index = SimilarSongs.load(path)
+            if len(index) == len(features):
+                print(f"Loaded similar songs index {path}")
+                return index
+            print(f"Similar songs index {path} does not match the dataset, rebuilding")
+        except Exception as e:
+            print(f"Could not load similar songs index {path}: {e}")
+
+    print("Building similar songs index")
+    index = SimilarSongs.build(features)
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"Could not save similar songs index {path}: {e}")
+    return index
@@ -0,0 +1,92 @@
+import http.server
+import json
+import threading
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+import pytest
+from audio_preview import make_client, resolve_preview, resolve_previews
+from preview_index import song_id
+
+PREVIEW_BYTES = b'ID3' + b'x' * 5000
+
+
+class StubDeezer(http.server.BaseHTTPRequestHandler):
+    """Deezer search API and preview CDN; songs whose title contains 'Missing' have no hit."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        port = self.server.server_address[1]
+        if self.path.startswith('/search'):
+            self.server.requests['search'] += 1
+            query = parse_qs(urlparse(self.path).query)['q'][0]
+            hits = [] if 'Missing' in query else [{
+                'id': 1,
+                'type': 'track',
+                'title': query,
+                'preview': f"http://127.0.0.1:{port}/previews/1.mp3"
+            }]
+            body = json.dumps({'data': hits, 'total': len(hits)}).encode()
+            content_type = 'application/json'
+        else:
+            self.server.requests['download'] += 1
+            body = PREVIEW_BYTES
+            content_type = 'audio/mpeg'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubDeezer)
+    server.requests = Counter()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def api_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_downloaded(stub, tmp_path):
+    client = make_client(timeout=5, api_url=api_url(stub))
+    song = song_id('Song', 'Band')
+
+    result = resolve_preview(client, song, 'Song', 'Band', str(tmp_path), timeout=5)
+
+    assert result['status'] == 'ok'
+    assert result['bytes'] == len(PREVIEW_BYTES)
+    with open(result['path'], 'rb') as f:
+        assert f.read() == PREVIEW_BYTES
+    assert stub.requests == {'search': 1, 'download': 1}
+
+
+def test_missing(stub, tmp_path):
+    client = make_client(timeout=5, api_url=api_url(stub))
+    song = song_id('Missing Song', 'Band')
+
+    result = resolve_preview(client, song, 'Missing Song', 'Band', str(tmp_path), timeout=5)
+
+    assert result == {'status': 'missing'}
+    assert stub.requests == {'search': 1}
+
+
+def test_cached(stub, tmp_path):
+    songs = [(song_id('Song', 'Band'), 'Song', 'Band'), (song_id('Missing Song', 'Band'), 'Missing Song', 'Band')]
+    first = resolve_previews(songs, timeout=5, download_dir=str(tmp_path), api_url=api_url(stub))
+    assert [status for _, _, _, status, _ in first] == ['downloaded', 'missing']
+    assert stub.requests == {'search': 2, 'download': 1}
+
+    # Both answers now come from the preview index, without any request
+    stub.requests.clear()
+    second = resolve_previews(songs, timeout=5, download_dir=str(tmp_path), api_url=api_url(stub))
+    assert [status for _, _, _, status, _ in second] == ['cached', 'known_missing']
+    assert second[0][4] == first[0][4]
+    assert sum(stub.requests.values()) == 0
@@ -0,0 +1,28 @@
+import os
+from flask import Flask
+import metrics
+from metrics import Registry
+
+
+def test_snapshots_only_written_once_enabled(tmp_path):
+    registry = Registry(directory=str(tmp_path), flush_interval=0)
+    registry.describe('things_total', 'counter', 'Things.')
+    registry.inc('things_total')
+    assert os.listdir(tmp_path) == []
+
+    registry.enabled = True
+    registry.inc('things_total')
+    assert len(os.listdir(tmp_path)) == 1
+    assert 'things_total 2' in registry.render()
+
+
+def test_init_app_enables_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics.registry, 'directory', str(tmp_path))
+    monkeypatch.setattr(metrics.registry, 'enabled', False)
+    server = Flask(__name__)
+    metrics.init_app(server)
+    assert metrics.registry.enabled
+
+    response = server.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,78 @@
+import threading
+from preview_prefetch import PRIORITY_VISIBLE, PreviewPrefetcher
+
+
+class BlockingResolver:
+    """Records the songs it resolves; the first call waits until released."""
+
+    def __init__(self):
+        self.resolved = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, songs):
+        if not self.resolved and not self.started.is_set():
+            self.started.set()
+            self.release.wait(5)
+        self.resolved.append(songs)
+
+
+def test_finished_job_keeps_requeued_marker():
+    started = [threading.Event(), threading.Event()]
+    release = [threading.Event(), threading.Event()]
+    resolved = []
+
+    def resolve(songs):
+        call = len(resolved)
+        resolved.append(songs)
+        started[call].set()
+        release[call].wait(5)
+
+    prefetcher = PreviewPrefetcher(resolve=resolve, workers=1)
+    prefetcher.submit((0, 1), 'prefetch')
+    assert started[0].wait(5)
+
+    # Re-queued at visible priority while the first job is still running
+    assert prefetcher.submit((0, 1), 'visible', priority=PRIORITY_VISIBLE)
+    release[0].set()
+    assert started[1].wait(5)
+    # The first job finishing must not clear the marker of the one now running
+    assert prefetcher.is_pending((0, 1))
+
+    release[1].set()
+    prefetcher.join()
+    assert resolved == ['prefetch', 'visible']
+    assert not prefetcher.is_pending((0, 1))
+
+
+def test_switch_only_cancels_own_session():
+    resolver = BlockingResolver()
+    prefetcher = PreviewPrefetcher(resolve=resolver, workers=1)
+    prefetcher.submit('block', 'block')
+    assert resolver.started.wait(5)
+
+    prefetcher.set_active_group(0, session='a')
+    prefetcher.set_active_group(0, session='b')
+    assert prefetcher.submit((0, 1), 'from a', group=0, session='a')
+    # Same page for another session: queued on its own, not deduplicated away
+    assert prefetcher.submit((0, 1), 'from b', group=0, session='b')
+    prefetcher.set_active_group(1, session='a')
+    assert not prefetcher.is_pending((0, 1), session='a')
+    assert prefetcher.is_pending((0, 1), session='b')
+
+    resolver.release.set()
+    prefetcher.join()
+    assert resolver.resolved == ['block', 'from b']
+
+
+def test_duplicate_from_same_session_is_ignored():
+    resolver = BlockingResolver()
+    prefetcher = PreviewPrefetcher(resolve=resolver, workers=1)
+    prefetcher.submit('block', 'block')
+    assert resolver.started.wait(5)
+
+    assert prefetcher.submit((0, 1), 'first', session='a')
+    assert not prefetcher.submit((0, 1), 'again', session='a')
+    resolver.release.set()
+    prefetcher.join()
+    assert resolver.resolved == ['block', 'first']
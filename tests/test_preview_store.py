@@ -0,0 +1,35 @@
+import os
+from preview_server import file_version
+from preview_store import PreviewStore
+
+
+def test_touch_keeps_file_version(tmp_path):
+    store = PreviewStore(str(tmp_path))
+    path, _ = store.write('0123456789abcdef', [b'ID3' + b'x' * 100])
+    # A sub-microsecond mtime is what a float round trip would lose
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns // 1000 * 1000 + 123))
+    version = file_version(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+
+    assert store.touch('0123456789abcdef')
+
+    assert os.stat(path).st_mtime_ns == mtime_ns
+    assert file_version(path) == version
+
+
+def test_touch_missing_preview(tmp_path):
+    assert not PreviewStore(str(tmp_path)).touch('0123456789abcdef')
+
+
+def test_file_version_follows_content(tmp_path):
+    store = PreviewStore(str(tmp_path))
+    path, _ = store.write('0123456789abcdef', [b'ID3' + b'x' * 100])
+    version = file_version(path)
+
+    # Same bytes, new timestamps: same version
+    os.utime(path, ns=(1, 1))
+    assert file_version(path) == version
+
+    store.write('0123456789abcdef', [b'ID3' + b'y' * 100])
+    assert file_version(path) != version
@@ -0,0 +1,134 @@
+"""
+Offline warm-up of the audio preview cache for the whole catalog.
+
+Resolves and downloads the preview of every song in the dataset into the
+audio_previews/ directory used by the dashboard, so deployments can ship a
+warm cache. Progress lives in the preview index, so an interrupted run picks
+up where it stopped.
+
+The cache budget (PREVIEW_CACHE_BYTES) is not applied while warming, so the
+run never evicts its own downloads; pass --max-bytes to cap it. The summary
+warns when the warmed cache is larger than the budget the dashboard will
+trim it to on startup.
+
+Usage:
+    warm-previews [--csv data/Spotify-2000.csv] [--workers 8] [--rate 8] [--max-bytes N]
+"""
+import argparse
+import os
+import time
+from collections import Counter
+import pandas as pd
+from audio_preview import DOWNLOAD_DIR, REQUEST_TIMEOUT, RateLimiter, get_store, resolve_previews
+from preview_store import PREVIEW_CACHE_BYTES
+from preview_index import song_id
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'Spotify-2000.csv')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download audio previews for every song in the catalog.")
+    parser.add_argument('--csv', default=DEFAULT_CSV, help="Dataset with 'Title' and 'Artist' columns")
+    parser.add_argument('--download-dir', default=DOWNLOAD_DIR, help="Preview cache directory")
+    parser.add_argument('--workers', type=int, default=8, help="Songs resolved concurrently")
+    parser.add_argument('--rate', type=float, default=8.0, help="Maximum Deezer searches per second")
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT, help="Per-request timeout in seconds")
+    parser.add_argument('--batch-size', type=int, default=100, help="Songs per progress report")
+    parser.add_argument('--retries', type=int, default=3, help="Retry rounds for failed songs")
+    parser.add_argument('--backoff', type=float, default=2.0, help="Seconds before the first retry, doubled each round")
+    parser.add_argument('--api-url', default=None, help="Override the Deezer API base URL")
+    parser.add_argument('--max-bytes', type=int, default=0,
+                        help="Cache budget while warming, in bytes (default: 0, no limit)")
+    return parser.parse_args(argv)
+
+
+def warm_previews(songs, workers=8, rate=8.0, timeout=REQUEST_TIMEOUT, batch_size=100,
+                  retries=3, backoff=2.0, download_dir=DOWNLOAD_DIR, api_url=None):
+    """
+    Resolve previews for all songs with rate limiting and retries.
+
+    Args:
+        songs: List of (song_id, title, artist) tuples
+
+    Returns:
+        tuple: (Counter of final statuses, list of songs that still failed)
+    """
+    limiter = RateLimiter(rate)
+    counts = Counter()
+    failed = []
+    start = time.time()
+
+    for batch_start in range(0, len(songs), batch_size):
+        batch = songs[batch_start:batch_start + batch_size]
+        results = resolve_previews(batch, workers, timeout, download_dir, api_url, limiter, retry_errors=True)
+        for song, title, artist, status, _ in results:
+            if status == 'error':
+                failed.append((song, title, artist))
+            else:
+                counts[status] += 1
+        done = batch_start + len(batch)
+        elapsed = time.time() - start
+        print(f"[warm-previews] {done}/{len(songs)} songs ({done / elapsed:.1f} songs/s), {len(failed)} failed so far")
+
+    for attempt in range(retries):
+        if not failed:
+            break
+        delay = backoff * (2 ** attempt)
+        print(f"[warm-previews] Retrying {len(failed)} failed songs in {delay:.0f}s (attempt {attempt + 1}/{retries})")
+        time.sleep(delay)
+        results = resolve_previews(failed, workers, timeout, download_dir, api_url, limiter, retry_errors=True)
+        failed = []
+        for song, title, artist, status, _ in results:
+            if status == 'error':
+                failed.append((song, title, artist))
+            else:
+                counts[status] += 1
+
+    return counts, failed
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    catalog = pd.read_csv(args.csv, usecols=['Title', 'Artist'])
+    songs = list({
+        song_id(title, artist): (song_id(title, artist), title, artist)
+        for title, artist in zip(catalog['Title'], catalog['Artist'])
+    }.values())
+    print(f"[warm-previews] Warming {len(songs)} songs from {args.csv} into {args.download_dir}")
+
+    # Set the budget before anything opens the store with the default one
+    store = get_store(args.download_dir, max_bytes=args.max_bytes or float('inf'))
+
+    start = time.time()
+    counts, failed = warm_previews(
+        songs,
+        workers=args.workers,
+        rate=args.rate,
+        timeout=args.timeout,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        backoff=args.backoff,
+        download_dir=args.download_dir,
+        api_url=args.api_url
+    )
+    elapsed = time.time() - start
+
+    hits = counts['cached'] + counts['known_missing']
+    misses = counts['downloaded'] + counts['missing'] + len(failed)
+    print("\n[warm-previews] Summary")
+    print(f"  Songs:        {len(songs)} in {elapsed:.1f}s ({len(songs) / max(elapsed, 1e-9):.1f} songs/s)")
+    print(f"  Cache hits:   {hits} ({counts['cached']} previews, {counts['known_missing']} known missing)")
+    print(f"  Cache misses: {misses} ({counts['downloaded']} downloaded, {counts['missing']} without preview)")
+    print(f"  Cache size:   {store.total_bytes() / 1024 / 1024:.0f} MB")
+    print(f"  Failures:     {len(failed)}")
+    for _, title, artist in failed:
+        print(f"    - {title} by {artist}")
+    if store.total_bytes() > PREVIEW_CACHE_BYTES:
+        print(f"\n[warm-previews] Warning: the cache is larger than PREVIEW_CACHE_BYTES "
+              f"({PREVIEW_CACHE_BYTES / 1024 / 1024:.0f} MB); the dashboard will evict previews on startup "
+              f"unless it runs with a larger PREVIEW_CACHE_BYTES")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())